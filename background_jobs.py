@@ -0,0 +1,143 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+import rerun_profiler
+
+# === TRABAJOS EN SEGUNDO PLANO QUE SOBREVIVEN A LOS RERUNS ===
+# Las generaciones largas (micronarrativas, segundo porqué) se envían a un pool de hilos
+# del proceso y la sesión sólo guarda el id del trabajo. Un fragmento que se refresca solo
+# muestra el avance y recoge el resultado cuando llega; un rerun o un clic a mitad de la
+# generación ya no la cancela ni obliga a pagarla de nuevo.
+#
+# Las funciones de trabajo corren fuera del hilo del script: reciben valores simples
+# y no deben leer ni escribir st.session_state. Cada paso completado se agrega a `partial`;
+# si el trabajo falla, `retry` lo relanza con esos pasos y sólo se repiten los que faltan.
+
+JOB_TTL_S = 3600        # Resultados no recogidos se descartan después de este tiempo
+POLL_INTERVAL_S = 1.0   # Cada cuánto se refresca el fragmento de progreso
+
+_jobs = {}              # Nivel proceso: job_id -> Job
+_jobs_lock = threading.Lock()
+
+
+class Job:
+    __slots__ = ("future", "done", "total", "finished_at", "partial", "run")
+
+    def __init__(self, total):
+        self.future = None
+        self.done = 0
+        self.total = total
+        self.finished_at = None
+        self.partial = []   # Resultados de los pasos ya completados
+        self.run = None     # Función que ejecuta (o reanuda) el trabajo
+
+
+@st.cache_resource
+def get_executor(max_workers=8):
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-job")
+
+
+# Descarta trabajos terminados hace más de JOB_TTL_S que nadie recogió
+def _prune():
+    now = time.time()
+    with _jobs_lock:
+        for job_id in [j for j, job in _jobs.items() if job.finished_at and now - job.finished_at > JOB_TTL_S]:
+            del _jobs[job_id]
+
+
+# Envía `fn(*args, report=..., partial=...)` al pool bajo el nombre `name` de la sesión actual.
+# `job_id` debe ser una llave idempotente (ver idempotency.request_key): si ya existe un
+# trabajo con ese id, en curso o terminado, la sesión se engancha a él en lugar de repetirlo.
+def submit(name, job_id, fn, *args, total=1):
+    _prune()
+    st.session_state.setdefault("jobs", {})[name] = job_id
+
+    with _jobs_lock:
+        if job_id in _jobs:
+            return job_id
+        job = Job(total)
+        _jobs[job_id] = job
+
+    # Cada paso completado actualiza el avance que muestra el fragmento
+    def report(done):
+        job.done = done
+
+    # Si el rerun que lanza el trabajo se está perfilando, los tramos del trabajo van a su propio reporte
+    profiler = rerun_profiler.current()
+
+    def run():
+        if profiler is not None:
+            rerun_profiler.start_job(profiler, name)
+        try:
+            return fn(*args, report=report, partial=job.partial)
+        finally:
+            job.finished_at = time.time()
+            rerun_profiler.finish_job()
+
+    job.run = run
+    _start(job)
+    return job_id
+
+
+def _start(job):
+    job.finished_at = None
+    job.done = len(job.partial)
+    workers = int(st.secrets.get("JOB_WORKERS", 8))
+    job.future = get_executor(workers).submit(job.run)
+
+
+def _session_job(name):
+    job_id = st.session_state.get("jobs", {}).get(name)
+    if job_id is None:
+        return None, None
+    with _jobs_lock:
+        return job_id, _jobs.get(job_id)
+
+
+# Estado del trabajo `name` de la sesión: None (no hay), "running", "done" o "error"
+def status(name):
+    job_id, job = _session_job(name)
+    if job_id is None:
+        return None
+    if job is None:
+        return "error"  # Expiró o se perdió (p. ej. el proceso se reinició)
+    if job.future is None or not job.future.done():
+        return "running"
+    return "error" if job.future.exception() is not None else "done"
+
+
+# Relanza el trabajo fallido `name` conservando sus pasos completados.
+# Devuelve False si ya no existe (expiró), para que la app lo vuelva a enviar completo.
+def retry(name):
+    _, job = _session_job(name)
+    if job is None or job.future is None or not job.future.done():
+        return False
+    _start(job)
+    return True
+
+
+# Olvida el trabajo `name` en la sesión y en el registro; devuelve el Job (o None)
+def discard(name):
+    job_id, job = _session_job(name)
+    st.session_state.get("jobs", {}).pop(name, None)
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+    return job
+
+
+# Recoge el resultado de un trabajo terminado (status "done") y lo olvida
+def collect(name):
+    return discard(name).future.result()
+
+
+# Fragmento que se refresca solo mientras el trabajo corre; al terminar recarga la app
+# completa para que el flujo principal recoja el resultado.
+@st.fragment(run_every=POLL_INTERVAL_S)
+def progress(name, label):
+    if status(name) != "running":
+        st.rerun()
+    _, job = _session_job(name)
+    st.progress(min(job.done / job.total, 1.0), text=f"💭 {label} ({job.done}/{job.total})")
@@ -0,0 +1,341 @@
+# === BENCHMARK DE COSTO POR RERUN DE LA APP ===
+# Ejecuta prototype_natalia_v1_teachers.py dentro del proceso con el AppTest de Streamlit,
+# con LLM y Google Sheets simulados, y mide para cada agentState:
+#   - tiempo de pared por rerun (mediana y máximo)
+#   - memoria asignada durante el rerun (tracemalloc, en una pasada aparte), descontando el
+#     pico de un script vacío para quedarse con lo que asigna la app
+#   - número de elementos renderizados
+#   - en los estados con chat, tiempo del rerun que dispara un mensaje del usuario (incluye
+#     la llamada al LLM)
+# Con --baseline compara contra una corrida guardada y falla si algún estado empeora.
+# Con --cassette las llamadas al LLM de esos reruns con mensaje se sirven desde un cassette
+# grabado (ver llm_cassette.py), con su latencia escalada por --latency-scale.
+#
+# Uso:
+#   python bench_reruns.py --save bench_baseline.json
+#   python bench_reruns.py --baseline bench_baseline.json --max-regression 1.25
+#   python bench_reruns.py --cassette cassettes/<session_id>.jsonl --latency-scale 0
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+try:
+    import tomllib  # stdlib, Python >= 3.11
+except ModuleNotFoundError:
+    import tomli as tomllib  # backport para Python < 3.11
+
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from session_store import Mensaje
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = "prototype_natalia_v1_teachers.py"
+DEFAULT_CONFIG = "config_natalia_v0.1_teachers.toml"
+
+SECRETS = {
+    "OPENAI_API_KEY": "sk-bench",
+    "LANGCHAIN_API_KEY": "ls-bench",
+    "LANGCHAIN_PROJECT": "bench",
+    "LANGCHAIN_TRACING_V2": "false",
+    "LANGCHAIN_ENDPOINT": "http://localhost",
+    "gcp_service_account": {},
+}
+
+STUB_RESPONSE = '{"output_scenario": "Narrativa simulada.", "new_scenario": "Versión simulada."}'
+INPUT_TEXT = "Me siento cansada después de clases."
+
+
+# === DOBLES DE PRUEBA PARA LLM Y GOOGLE SHEETS ===
+class FakeWorksheet:
+    def __init__(self):
+        self.rows = []
+
+    def append_row(self, row, **kwargs):
+        self.rows.append(row)
+
+    def append_rows(self, rows, **kwargs):
+        self.rows.extend(rows)
+
+    def get_all_values(self):
+        return self.rows
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.sheet1 = FakeWorksheet()
+        self.worksheets = {}
+
+    def worksheet(self, title):
+        return self.worksheets.setdefault(title, FakeWorksheet())
+
+    def add_worksheet(self, title, **kwargs):
+        return self.worksheet(title)
+
+
+class FakeGSClient:
+    def open(self, name):
+        return FakeSpreadsheet()
+
+
+def fake_chat_openai(*args, **kwargs):
+    return FakeListChatModel(responses=[STUB_RESPONSE])
+
+
+# === HISTORIALES REALISTAS A PARTIR DEL TOML ===
+# Usa las preguntas y el ejemplo one-shot del archivo de configuración para sembrar
+# conversaciones de tamaño parecido al de una sesión real.
+def load_fixtures(config_file):
+    with open(config_file, "rb") as f:
+        config = tomllib.load(f)
+
+    answers = [
+        line.split(":", 1)[1].strip().replace("\\n", "")
+        for line in config["example"]["conversation"].splitlines()
+        if line.startswith("Respuesta:")
+    ]
+    questions = config["collection"]["questions"]
+    scenario = " ".join(config["example"]["scenario"].split())
+
+    def chat(intro, turns):
+        records = [Mensaje("ai", intro.strip())]
+        for question, answer in turns:
+            records.append(Mensaje("human", answer))
+            records.append(Mensaje("ai", f"Gracias por contarme. **{question}**"))
+        return records
+
+    questions_history = chat(config["collection"]["intro"], zip(questions, answers))
+    reflect_history = chat(config["reflect"]["intro"], [(config["reflect"]["instruction"], "Estaba muy agitada."), ("", "Listo")])
+    abcd_history = chat(config["abcd"]["atencion"]["intro"], zip(config["abcd"]["atencion"]["followups"], answers))
+    adaptations = [Mensaje("human", "Hazla más breve."), Mensaje("ai", scenario)]
+    return {
+        "questions": questions_history,
+        "reflect": reflect_history,
+        "abcd": abcd_history,
+        "scenario": scenario,
+        "adaptations": adaptations,
+    }
+
+
+# Estado de sesión sembrado para cada agentState (acumulativo, como en la app real)
+def build_states(fx):
+    base = {"consent": True, "langchain_messages": fx["questions"]}
+    select = {**base, "agentState": "select_micronarrative", "micronarrativas": [fx["scenario"]] * 3}
+    summarise1 = {**base, "agentState": "summarise1", "summarise1": True, "primer_porque": fx["scenario"],
+                  "persona_elegida_idx": 0, "adaptation_messages": fx["adaptations"]}
+    reflect = {**summarise1, "agentState": "reflect", "reflect": True, "reflect_messages": fx["reflect"]}
+    sliders = {**reflect, "agentState": "sliders", "sliders": True}
+    abcd = {**sliders, "agentState": "abcd", "abcd": True, "abcd_messages": fx["abcd"]}
+    summarise2 = {**abcd, "agentState": "summarise2", "summarise2": True, "segundo_porque": fx["scenario"],
+                  "adaptation_messages2": fx["adaptations"]}
+    end = {**summarise2, "agentState": "end", "vista_final": True}
+    return {
+        "start": {},
+        "chat": {**base, "agentState": "chat"},
+        "select_micronarrative": select,
+        "summarise1": summarise1,
+        "reflect": reflect,
+        "sliders": sliders,
+        "abcd": abcd,
+        "summarise2": summarise2,
+        "end": end,
+    }
+
+
+# Cuenta los elementos renderizados recorriendo el árbol del AppTest
+def count_elements(node):
+    children = getattr(node, "children", None)
+    if isinstance(children, dict):
+        return 1 + sum(count_elements(c) for c in children.values())
+    return 1
+
+
+# Crea el AppTest, aplica secrets y estado, y ejecuta un rerun de calentamiento
+def make_app(config_file, seed, extra_secrets=None):
+    at = AppTest.from_file(APP_FILE, default_timeout=60)
+    for key, value in {**SECRETS, **(extra_secrets or {})}.items():
+        at.secrets[key] = value
+    at.secrets["CONFIG_FILE"] = config_file
+    for key, value in seed.items():
+        # Copias para que los reruns no modifiquen los datos sembrados de otros estados
+        at.session_state[key] = list(value) if isinstance(value, list) else value
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"La app falló al sembrar el estado: {at.exception[0].message}")
+    return at
+
+
+# Mediana del pico de memoria de `reruns` ejecuciones del AppTest
+def median_peak(at, reruns):
+    peaks = []
+    for _ in range(reruns):
+        tracemalloc.start()
+        at.run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+    return statistics.median(peaks)
+
+
+# Pico de memoria del propio AppTest con un script vacío; se descuenta del de cada estado
+def harness_peak(reruns):
+    at = AppTest.from_string("", default_timeout=60)
+    at.run()
+    return median_peak(at, reruns)
+
+
+# Mide `reruns` ejecuciones de un estado ya sembrado. El tiempo y la memoria se miden en
+# pasadas separadas: tracemalloc encarece cada asignación y distorsionaría los tiempos.
+def measure_state(config_file, seed, reruns, extra_secrets=None, baseline_peak=0):
+    at = make_app(config_file, seed, extra_secrets)
+    times = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - t0)
+    peak = median_peak(at, reruns)
+    if at.exception:
+        raise RuntimeError(f"La app falló durante el benchmark: {at.exception[0].message}")
+    result = {
+        "median_s": statistics.median(times),
+        "max_s": max(times),
+        "peak_alloc_bytes": max(0, int(peak - baseline_peak)),
+        "elements": count_elements(at._tree),
+    }
+    if at.chat_input:
+        input_times = measure_input(config_file, seed, reruns, extra_secrets)
+        result["input_median_s"] = statistics.median(input_times)
+        result["input_max_s"] = max(input_times)
+    return result
+
+
+# Mide el rerun que dispara un mensaje en el chat del estado. Cada medición parte de una sesión
+# nueva (y de un cassette nuevo): el mensaje cambia el historial y, tras un st.rerun() dentro
+# del script, el AppTest conserva widgets obsoletos.
+def measure_input(config_file, seed, reruns, extra_secrets=None):
+    times = []
+    for _ in range(reruns):
+        at = make_app(config_file, seed, extra_secrets)
+        t0 = time.perf_counter()
+        at.chat_input[0].set_value(INPUT_TEXT).run()
+        times.append(time.perf_counter() - t0)
+        if at.exception:
+            raise RuntimeError(f"La app falló al enviar un mensaje: {at.exception[0].message}")
+    return times
+
+
+# Secrets que activan la reproducción de un cassette dentro de la app
+def cassette_secrets(cassette, latency_scale):
+    if not cassette:
+        return {}
+    return {
+        "LLM_CASSETTE_MODE": "replay",
+        "LLM_CASSETTE_FILE": os.path.abspath(cassette),
+        "LLM_REPLAY_LATENCY_SCALE": latency_scale,
+    }
+
+
+# Ruta del TOML: tal cual si existe desde el directorio actual; si no, relativa a la app
+def resolve_config(config_file):
+    if os.path.exists(config_file):
+        return os.path.abspath(config_file)
+    return os.path.join(APP_DIR, config_file)
+
+
+def run_benchmark(config_file, reruns, states=None, cassette=None, latency_scale=0.0):
+    config_file = resolve_config(config_file)
+    extra_secrets = cassette_secrets(cassette, latency_scale)
+    fixtures = load_fixtures(config_file)
+    all_states = build_states(fixtures)
+    selected = states or list(all_states)
+    results = {}
+    # El AppTest crea un ScriptCache por rerun y recompila el script cada vez; el servidor
+    # compila una sola vez. Se comparte uno para no medir la compilación en cada rerun.
+    script_cache = ScriptCache()
+    # El script lee sys.argv y rutas relativas, se ejecuta desde la carpeta de la app
+    with mock.patch("langchain_openai.ChatOpenAI", fake_chat_openai), \
+         mock.patch("gspread.authorize", lambda credentials: FakeGSClient()), \
+         mock.patch("oauth2client.service_account.ServiceAccountCredentials.from_json_keyfile_dict", lambda *a, **k: None), \
+         mock.patch("langsmith.Client", mock.MagicMock()), \
+         mock.patch.object(sys, "argv", [APP_FILE]), \
+         mock.patch("streamlit.testing.v1.local_script_runner.ScriptCache", lambda: script_cache):
+        cwd = os.getcwd()
+        os.chdir(APP_DIR)
+        try:
+            baseline_peak = harness_peak(reruns)
+            for state in selected:
+                results[state] = measure_state(config_file, all_states[state], reruns, extra_secrets, baseline_peak)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+# Compara contra la línea base y devuelve la lista de regresiones encontradas
+def find_regressions(results, baseline, max_regression):
+    regressions = []
+    for state, current in results.items():
+        previous = baseline.get(state)
+        if previous is None:
+            continue
+        for metric in ("median_s", "peak_alloc_bytes", "elements", "input_median_s"):
+            if metric not in current or metric not in previous:
+                continue
+            limit = previous[metric] * max_regression
+            if current[metric] > limit:
+                regressions.append(
+                    f"{state}: {metric} {current[metric]:.4g} > {limit:.4g} (base {previous[metric]:.4g})"
+                )
+    return regressions
+
+
+def print_report(results):
+    print(f"{'estado':<24}{'mediana ms':>12}{'máx ms':>10}{'pico KiB':>12}{'elementos':>11}{'mensaje ms':>12}")
+    for state, r in results.items():
+        message = f"{r['input_median_s'] * 1000:.1f}" if "input_median_s" in r else "-"
+        print(f"{state:<24}{r['median_s'] * 1000:>12.1f}{r['max_s'] * 1000:>10.1f}"
+              f"{r['peak_alloc_bytes'] / 1024:>12.1f}{r['elements']:>11}{message:>12}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del costo de un rerun por agentState.")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Archivo TOML de la app")
+    parser.add_argument("--reruns", type=int, default=10, help="Reruns medidos por estado")
+    parser.add_argument("--state", action="append", help="Medir sólo este estado (se puede repetir)")
+    parser.add_argument("--cassette", help="Cassette JSONL para servir las respuestas del LLM")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="Factor de la latencia grabada al reproducir el cassette (1 = original)")
+    parser.add_argument("--save", help="Guarda los resultados como JSON (línea base)")
+    parser.add_argument("--baseline", help="Línea base JSON contra la cual comparar")
+    parser.add_argument("--max-regression", type=float, default=1.25,
+                        help="Factor máximo permitido respecto a la línea base (1.25 = +25%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.config, args.reruns, args.state, args.cassette, args.latency_scale)
+    print_report(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print("\n❌ Regresiones detectadas:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\n✅ Sin regresiones respecto a la línea base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import importlib.util
+import threading
+import weakref
+
+import httpx
+import streamlit as st
+
+# === CLIENTE HTTP COMPARTIDO PARA LAS LLAMADAS AL LLM ===
+# Un solo httpx.Client por proceso, con keep-alive y HTTP/2 (httpx[http2] en requirements.txt),
+# que se inyecta en cada ChatOpenAI para reutilizar las conexiones TLS entre sesiones.
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+# Cuenta cuántas respuestas usaron una conexión nueva y cuántas reutilizaron una existente.
+# Cada conexión de httpcore expone su `network_stream`; si ya lo vimos, la conexión se reutilizó.
+class PoolStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = weakref.WeakSet()
+        self.opened = 0
+        self.reused = 0
+
+    def on_response(self, response):
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        with self._lock:
+            if stream in self._streams:
+                self.reused += 1
+            else:
+                self._streams.add(stream)
+                self.opened += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.opened + self.reused
+            return {
+                "opened": self.opened,
+                "reused": self.reused,
+                "reuse_ratio": self.reused / total if total else 0.0,
+            }
+
+
+# Crea (una sola vez por proceso y por combinación de parámetros) el cliente compartido
+@st.cache_resource
+def get_http_client(max_connections=20, max_keepalive=10, keepalive_expiry=60.0,
+                    timeout=60.0, connect_timeout=5.0):
+    stats = PoolStats()
+    client = httpx.Client(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        event_hooks={"response": [stats.on_response]},
+    )
+    client.pool_stats = stats
+    return client
+
+
+# Lee la configuración del pool desde los secrets (todas las claves son opcionales)
+def http_client_from_secrets(secrets):
+    return get_http_client(
+        max_connections=int(secrets.get("HTTP_POOL_SIZE", 20)),
+        max_keepalive=int(secrets.get("HTTP_POOL_KEEPALIVE", 10)),
+        keepalive_expiry=float(secrets.get("HTTP_KEEPALIVE_EXPIRY", 60.0)),
+        timeout=float(secrets.get("HTTP_TIMEOUT", 60.0)),
+        connect_timeout=float(secrets.get("HTTP_CONNECT_TIMEOUT", 5.0)),
+    )
+
+
+# Muestra en la barra lateral las estadísticas del pool (sólo para depuración)
+def render_pool_stats(client):
+    stats = client.pool_stats.snapshot()
+    with st.sidebar.expander("🔌 Conexiones HTTP al LLM", expanded=False):
+        st.markdown(
+            f"**HTTP/2:** {'sí' if HTTP2_AVAILABLE else 'no'}  \n"
+            f"**Conexiones abiertas:** {stats['opened']}  \n"
+            f"**Reutilizadas:** {stats['reused']} ({stats['reuse_ratio']:.0%})"
+        )
@@ -0,0 +1,70 @@
+import hashlib
+import json
+
+import streamlit as st
+
+import rerun_profiler
+
+# === LLAMADAS Y GUARDADOS IDEMPOTENTES POR SESIÓN ===
+# Cada llamada al LLM o guardado en Sheets se identifica con una llave derivada del
+# id de sesión, la etapa y sus entradas. Si la misma llave ya terminó (doble clic, envío
+# repetido que interrumpió el rerun anterior) se devuelve el resultado guardado en la sesión.
+# No hace falta esperar a una ejecución en curso: los reruns de una sesión se ejecutan uno
+# tras otro en su mismo hilo y las llaves incluyen el id de sesión, así que dos ejecuciones
+# de la misma llave nunca corren a la vez.
+
+MAX_RESULTADOS = 32  # Resultados completados que se conservan por sesión
+
+
+# Llave estable para una operación de la sesión actual
+def request_key(stage, *parts):
+    raw = json.dumps([st.session_state.session_id, stage, *parts], ensure_ascii=False, default=str)
+    return f"{stage}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]}"
+
+
+# ¿Ya hay un resultado guardado en la sesión para esta llave?
+def has_result(key):
+    return key in st.session_state.get("idem_results", {})
+
+
+# === TURNOS DE CHAT ===
+# La llave de un turno no puede derivarse del historial: el propio turno lo modifica y un
+# reenvío en el siguiente rerun tendría otra llave. Se recuerda el último turno de cada etapa
+# con la llave calculada con el estado *antes* del turno. Si llega la misma entrada y su
+# respuesta nunca se llegó a mostrar (el rerun del reenvío interrumpió al anterior), es un
+# envío duplicado y reutiliza esa llave. Si ya se mostró, la misma entrada es un turno nuevo
+# (p. ej. volver a escribir "listo" cuando el bot lo pide otra vez).
+def turn_key(stage, text, *state):
+    turns = st.session_state.setdefault("idem_turns", {})
+    last = turns.get(stage)
+    if last is not None and last["input"] == text and not last["delivered"]:
+        return last["key"]
+    key = request_key(stage, *state, text)
+    turns[stage] = {"input": text, "key": key, "delivered": False}
+    return key
+
+
+# Marca que la respuesta del último turno de la etapa ya se mostró al usuario. Desde ahí la
+# respuesta vive en el historial y la misma entrada sería un turno nuevo con otra llave, así
+# que se descarta el resultado guardado para no tener cada respuesta dos veces en la sesión.
+def mark_delivered(stage):
+    turn = st.session_state.get("idem_turns", {}).get(stage)
+    if turn is not None:
+        turn["delivered"] = True
+        st.session_state.get("idem_results", {}).pop(turn["key"], None)
+
+
+# Ejecuta `fn` y recuerda el resultado en la sesión: si la misma operación se vuelve a pedir
+# después de terminar, se devuelve sin ejecutarla de nuevo.
+# `fn` debe devolver sólo lo necesario (no historiales completos) para no duplicar memoria.
+def run_once(key, fn):
+    results = st.session_state.setdefault("idem_results", {})
+    if key in results:
+        return results[key]
+
+    with rerun_profiler.span(key.split(":", 1)[0]):
+        result = fn()
+    results[key] = result
+    while len(results) > MAX_RESULTADOS:
+        del results[next(iter(results))]
+    return result
@@ -0,0 +1,165 @@
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter, namedtuple
+
+# === FILTRO LOCAL DE ENTRADAS ANTES DE LLAMAR AL LLM ===
+# Responde al instante, con plantillas de la sección [prefilter] del TOML, los mensajes
+# vacíos, de relleno, repetidos o claramente fuera de tema. Usa reglas simples y un
+# clasificador Naive Bayes entrenado con los ejemplos del mismo archivo de configuración.
+#
+# Modos ([prefilter].mode):
+#   off     no clasifica ni registra nada
+#   shadow  clasifica y registra cada decisión, pero todo va al LLM (para calibrarlo)
+#   on      responde con plantilla lo que no deba ir al LLM
+MODES = ("off", "shadow", "on")
+
+logger = logging.getLogger("natalia.prefilter")
+LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+
+# label: "llm" (se manda al modelo), "empty", "filler", "repeated" u "off_topic"
+Decision = namedtuple("Decision", ["label", "confidence", "reply"])
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+BOLD_RE = re.compile(r"\*\*(.+?)\*\*", re.DOTALL)
+
+
+# Minúsculas y sin acentos, para que "Qué" y "que" cuenten como la misma palabra
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+# Streamlit sólo configura su propio logger; sin un handler propio las decisiones (INFO)
+# se perderían. Sin `path` se escriben en stderr, con `path` en ese archivo.
+def configure_logging(level="INFO", path=None):
+    logger.setLevel(level)
+    if logger.handlers:
+        return  # Ya configurado en un rerun anterior
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.propagate = False
+
+
+# Clasificador multinomial Naive Bayes de dos clases (on_topic / off_topic) con suavizado de Laplace.
+# Sólo puntúan las palabras que aparecen en los ejemplos: con pocos ejemplos fuera de tema, una palabra
+# desconocida empujaría hacia "fuera de tema" sólo porque esa clase tiene menos palabras en total.
+class LexicalModel:
+
+    def __init__(self, on_topic, off_topic):
+        self.counts = {
+            "on_topic": Counter(t for text in on_topic for t in tokenize(text)),
+            "off_topic": Counter(t for text in off_topic for t in tokenize(text)),
+        }
+        self.totals = {label: sum(c.values()) for label, c in self.counts.items()}
+        n_docs = len(on_topic) + len(off_topic)
+        self.priors = {
+            "on_topic": math.log(max(len(on_topic), 1) / max(n_docs, 1)),
+            "off_topic": math.log(max(len(off_topic), 1) / max(n_docs, 1)),
+        }
+        self.vocabulary = set(self.counts["on_topic"]) | set(self.counts["off_topic"])
+
+    # Proporción de palabras del texto que el modelo conoce
+    def known_share(self, tokens):
+        return sum(t in self.vocabulary for t in tokens) / len(tokens) if tokens else 0.0
+
+    # Probabilidad posterior de que el texto esté fuera de tema (ignorando palabras desconocidas)
+    def off_topic_probability(self, tokens):
+        v = len(self.vocabulary) or 1
+        known = [t for t in tokens if t in self.vocabulary]
+        scores = {}
+        for label, counts in self.counts.items():
+            score = self.priors[label]
+            for t in known:
+                score += math.log((counts[t] + 1) / (self.totals[label] + v))
+            scores[label] = score
+        top = max(scores.values())
+        exp = {label: math.exp(s - top) for label, s in scores.items()}
+        return exp["off_topic"] / sum(exp.values())
+
+
+class InputFilter:
+
+    # `config` es la sección [prefilter] del TOML; `seed_on_topic` son textos del propio
+    # cuestionario que se suman a los ejemplos en tema para entrenar el modelo.
+    def __init__(self, config, seed_on_topic=()):
+        # `enabled` (versiones anteriores del TOML) equivale a mode = "on" / "off"
+        self.mode = config.get("mode", "on" if config.get("enabled", False) else "off")
+        if self.mode not in MODES:
+            raise ValueError(f"[prefilter].mode debe ser uno de {MODES}, no {self.mode!r}")
+        self.threshold = config.get("threshold", 0.85)
+        self.min_chars = config.get("min_chars", 2)
+        self.min_tokens = config.get("min_tokens", 3)   # Menos palabras que esto no pasan por el modelo
+        self.min_known_share = config.get("min_known_share", 0.6)  # Mínimo de palabras conocidas para decidir
+        self.log_text = config.get("log_text", False)
+        configure_logging(config.get("log_level", "INFO"), config.get("log_file"))
+        self.fillers = {normalize(w) for w in config.get("fillers", [])}
+        self.replies = config.get("replies", {})
+
+        examples = config.get("examples", {})
+        on_topic = list(examples.get("on_topic", [])) + list(seed_on_topic)
+        off_topic = list(examples.get("off_topic", []))
+        self.model = LexicalModel(on_topic, off_topic) if off_topic else None
+
+    # Decide si el mensaje se responde localmente o se manda al LLM
+    def classify(self, text, history_records):
+        normalized = normalize(text)
+        tokens = tokenize(text)
+
+        if len("".join(tokens)) < self.min_chars:
+            return Decision("empty", 1.0, self.replies.get("empty"))
+
+        if self.fillers and all(t in self.fillers for t in tokens):
+            return Decision("filler", 1.0, self.replies.get("filler"))
+
+        # Repetido sólo si el mismo mensaje sigue sin respuesta del bot (envío duplicado);
+        # contestar igual a otra pregunta ("no", "listo") es una respuesta válida
+        last = history_records[-1] if history_records else None
+        if last is not None and last.role == "human" and normalize(last.content) == normalized:
+            return Decision("repeated", 1.0, self.replies.get("repeated"))
+
+        if (self.model is not None and len(tokens) >= self.min_tokens
+                and self.model.known_share(tokens) >= self.min_known_share):
+            p_off = self.model.off_topic_probability(tokens)
+            if p_off >= self.threshold:
+                return Decision("off_topic", p_off, self.replies.get("off_topic"))
+            return Decision("llm", 1.0 - p_off, None)
+
+        return Decision("llm", 1.0, None)
+
+    # Registra la decisión y, sólo en modo "on", agrega al historial el mensaje del usuario y
+    # la respuesta de plantilla. Devuelve True cuando el mensaje ya quedó respondido sin el LLM.
+    def handle(self, text, history, stage):
+        if self.mode == "off":
+            return False
+
+        decision = self.classify(text, history.records)
+        would_answer = decision.label != "llm" and bool(decision.reply)
+        answered = would_answer and self.mode == "on"
+        logger.info(
+            "prefilter mode=%s stage=%s label=%s confidence=%.3f would_answer=%s answered=%s chars=%d%s",
+            self.mode, stage, decision.label, decision.confidence, would_answer, answered, len(text),
+            f" text={text[:120]!r}" if self.log_text else "",
+        )
+        if not answered:
+            return False
+
+        history.add_user_message(text)
+        history.add_ai_message(decision.reply.format(pregunta=last_question(history.records)).strip())
+        return True
+
+
+# Última pregunta en negritas que hizo el bot, para repetirla en la respuesta de plantilla
+def last_question(records):
+    for m in reversed(records):
+        if m.role == "ai":
+            bold = BOLD_RE.findall(m.content)
+            if bold:
+                return f"**{bold[-1].strip()}**"
+    return ""
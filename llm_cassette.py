@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# === GRABACIÓN Y REPRODUCCIÓN DEL TRÁFICO CON EL LLM ("cassettes") ===
+# En modo "record" cada par prompt/respuesta de una sesión se guarda en un archivo JSONL
+# (una interacción por línea, con su latencia). En modo "replay" las respuestas se sirven
+# desde ese archivo, con la latencia original o escalada, sin llamar a la API.
+# Si un prompt no coincide con el grabado se reporta como discrepancia.
+
+logger = logging.getLogger("natalia.cassette")
+
+MODES = ("off", "record", "replay")
+
+
+def prompt_hash(prompt):
+    raw = json.dumps(prompt, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class Cassette:
+
+    def __init__(self, path, mode, latency_scale=1.0, strict=False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Modo de cassette inválido: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self.interactions = []  # Sólo en replay; al grabar las entradas viven en el archivo
+        self.recorded = 0
+        self.used = set()
+        self.mismatches = []
+        self._lock = threading.Lock()
+
+        if mode == "replay":
+            with open(path, "r", encoding="utf-8") as f:
+                self.interactions = [json.loads(line) for line in f if line.strip()]
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # Guarda una interacción al final del archivo (se escribe en cuanto ocurre). No se
+    # conserva en memoria: el cassette vive en session_state y cada prompt repite el historial.
+    def record(self, prompt, response, latency_s):
+        with self._lock:
+            entry = {
+                "i": self.recorded,
+                "prompt_hash": prompt_hash(prompt),
+                "prompt": prompt,
+                "response": response,
+                "latency_s": round(latency_s, 4),
+            }
+            self.recorded += 1
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    # Busca la respuesta grabada para un prompt: primero una coincidencia exacta no usada;
+    # si no la hay, la siguiente interacción pendiente en orden, reportando la discrepancia.
+    def lookup(self, prompt):
+        h = prompt_hash(prompt)
+        with self._lock:
+            pending = [e for e in self.interactions if e["i"] not in self.used]
+            match = next((e for e in pending if e["prompt_hash"] == h), None)
+            if match is None:
+                if self.strict or not pending:
+                    raise LookupError(f"No hay respuesta grabada para el prompt {h} en {self.path}")
+                match = pending[0]
+                mismatch = {"expected": match["prompt_hash"], "got": h, "interaction": match["i"]}
+                self.mismatches.append(mismatch)
+                logger.warning("cassette mismatch path=%s interaction=%d expected=%s got=%s",
+                               self.path, match["i"], match["prompt_hash"], h)
+            self.used.add(match["i"])
+        return match
+
+
+# Modelo de chat que envuelve a otro (grabando) o lo sustituye (reproduciendo)
+class CassetteChatModel(BaseChatModel):
+    inner: Optional[BaseChatModel] = None
+    cassette: Any = None
+
+    @property
+    def _llm_type(self):
+        return f"cassette-{self.cassette.mode}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = [[m.type, m.content] for m in messages]
+
+        if self.cassette.mode == "replay":
+            entry = self.cassette.lookup(prompt)
+            time.sleep(entry["latency_s"] * self.cassette.latency_scale)
+            content = entry["response"]
+        else:
+            t0 = time.perf_counter()
+            content = self.inner.invoke(messages, stop=stop, **kwargs).content
+            self.cassette.record(prompt, content, time.perf_counter() - t0)
+
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+# Crea el cassette según la configuración (secrets o variables de entorno).
+#   LLM_CASSETTE_MODE          off | record | replay
+#   LLM_CASSETTE_DIR           carpeta donde se graban los cassettes (uno por sesión)
+#   LLM_CASSETTE_FILE          cassette a reproducir en modo replay
+#   LLM_REPLAY_LATENCY_SCALE   factor de latencia al reproducir (0 = instantáneo)
+#   LLM_REPLAY_STRICT          si es verdadero, una discrepancia detiene la reproducción
+def cassette_from_settings(settings, session_id):
+    def get(key, default=None):
+        return settings.get(key, os.environ.get(key, default))
+
+    mode = str(get("LLM_CASSETTE_MODE", "off")).lower()
+    if mode not in MODES:
+        raise ValueError(f"LLM_CASSETTE_MODE debe ser uno de {MODES}, no {mode!r}")
+    if mode == "off":
+        return None
+    if mode == "record":
+        path = os.path.join(get("LLM_CASSETTE_DIR", "cassettes"), f"{session_id}.jsonl")
+    else:
+        path = get("LLM_CASSETTE_FILE")
+        if not path:
+            raise ValueError("LLM_CASSETTE_MODE=replay requiere LLM_CASSETTE_FILE")
+    return Cassette(
+        path,
+        mode,
+        latency_scale=float(get("LLM_REPLAY_LATENCY_SCALE", 1.0)),
+        strict=str(get("LLM_REPLAY_STRICT", "false")).lower() in ("1", "true", "yes"),
+    )
+
+
+# Envuelve el modelo si hay un cassette activo; si no, lo devuelve tal cual
+def with_cassette(chat, cassette):
+    if cassette is None:
+        return chat
+    return CassetteChatModel(inner=chat, cassette=cassette)
@@ -28,16 +28,30 @@ class LLMConfig:
             "pero déjame verificarlo."
         )
 
+        # Modo exprés (opcional): las preguntas se responden de una vez en un formulario y, como
+        # máximo, una sola llamada al LLM pide ampliar las respuestas demasiado breves
+        collection = config["collection"]
+        self.questions = list(collection["questions"])
+        self.express = collection.get("express", False)
+        self.express_intro = collection.get("express_intro", self.questions_intro).strip()
+        self.express_followup = collection.get("express_followup", True)
+        self.express_min_chars = collection.get("express_min_chars", 40)  # Respuestas más cortas se consideran breves
+        self.express_followup_prompt_template = self.generate_express_followup_prompt_template(collection)
+
         # Prompt para extracción de información y resumen en JSON
         self.extraction_task = "Crea un escenario basado en estas respuestas."
         self.extraction_prompt_template = self.generate_extraction_prompt_template(config["summaries"])
         self.summary_keys = list(config["summaries"]["questions"].keys())  # Claves JSON para extracción
-        self.extraction_adaptation_prompt_template = self.generate_adaptation_prompt_template()
+        # Número de versiones alternativas que devuelve cada petición de mejora con IA (1 = una sola)
+        self.adaptation_variants = max(1, int(config.get("adaptation", {}).get("variants", 1)))
+        self.extraction_adaptation_prompt_template = self.generate_adaptation_prompt_template(self.adaptation_variants)
 
         # Lista de personalidades para generar micronarrativas (ej. Psicólogo, Amigo, Periodista)
         self.personas = [persona.strip() for persona in list(config["summaries"]["personas"].values())]
+        self.persona_names = list(config["summaries"]["personas"].keys())
 
         # Ejemplo one-shot para guiar al modelo LLM
+        self.example_scenario = config["example"]["scenario"].strip()
         self.one_shot = self.generate_one_shot(config["example"])
 
         # Plantilla principal para generar la narrativa final
@@ -72,6 +86,15 @@ class LLMConfig:
             "direccion": config["abcd"]["direccion"],
         }
 
+        # Filtro local de entradas (opcional); las preguntas de cada etapa sirven como ejemplos en tema
+        self.prefilter = config.get("prefilter", {})
+        self.prefilter_seed = list(config["collection"]["questions"]) + [
+            question for dim in self.abcd_dims.values() for question in dim["followups"]
+        ]
+
+        # Presupuestos de tokens por etapa (opcional), usados por prompt_budget.py
+        self.budgets = config.get("budgets", {})
+
 
     # Genera la plantilla de prompt para hacer preguntas empáticas y secuenciales
     def generate_questions_prompt_template(self, data_collection):
@@ -137,6 +160,25 @@ class LLMConfig:
 
         return questions_prompt
 
+    # Genera el prompt del modo exprés: revisa las respuestas del formulario y devuelve JSON
+    # con 'followups', una pregunta de seguimiento por cada respuesta demasiado breve (o ninguna)
+    def generate_express_followup_prompt_template(self, data_collection):
+        followup_prompt = (
+            f"{data_collection['persona']}\n\n"
+            "La persona respondió de una sola vez el siguiente cuestionario:\n\n"
+            "{answers}\n\n"
+            "Revisa sólo estas respuestas, que parecen breves:\n\n"
+            "{thin_answers}\n\n"
+            "Para cada una que no dé información suficiente para entender la situación, escribe una pregunta de "
+            "seguimiento breve y empática que pida los detalles que faltan, sin repetir información que ya esté en otras "
+            "respuestas. Si una respuesta breve ya es suficiente, no hagas pregunta para ella. "
+            "No hagas más de una pregunta por respuesta. "
+            "Usa un lenguaje empático, sencillo y en segunda persona.\n\n"
+            "Devuelve tu respuesta como un archivo JSON con una sola entrada llamada 'followups', "
+            "que sea una lista de preguntas (puede estar vacía)."
+        )
+        return followup_prompt
+
     # Genera el prompt para extraer respuestas relevantes en JSON sin inventar información
     def generate_extraction_prompt_template(self, summaries):
         keys = list(summaries['questions'].keys())
@@ -167,17 +209,30 @@ class LLMConfig:
         return extraction_prompt
 
 
-    # Genera el prompt para adaptar una narrativa según la petición del usuario (JSON con 'new_scenario')
-    def generate_adaptation_prompt_template(self):
+    # Genera el prompt para adaptar una narrativa según la petición del usuario.
+    # Con una variante devuelve JSON con 'new_scenario'; con varias, una lista en 'new_scenarios'.
+    def generate_adaptation_prompt_template(self, variants=1):
         prompt_adaptation = (
             "Eres un asistente servicial, ayudando a estudiantes a adaptar un escenario a su gusto. "
             "El escenario original con el que vino este estudiante:\n\n"
             "Escenario: {scenario}.\n\n"
             "Su petición actual es {input}.\n\n"
-            "Sugiere una versión alternativa del escenario. Mantén el lenguaje y el contenido tan similares como sea posible, "
-            "cumpliendo con la petición del estudiante.\n\n"
-            "Devuelve tu respuesta como un archivo JSON con una sola entrada llamada 'new_scenario'."
         )
+
+        if variants == 1:
+            prompt_adaptation += (
+                "Sugiere una versión alternativa del escenario. Mantén el lenguaje y el contenido tan similares como sea posible, "
+                "cumpliendo con la petición del estudiante.\n\n"
+                "Devuelve tu respuesta como un archivo JSON con una sola entrada llamada 'new_scenario'."
+            )
+        else:
+            prompt_adaptation += (
+                f"Sugiere {variants} versiones alternativas del escenario, distintas entre sí en cómo cumplen la petición "
+                "(por ejemplo en tono, extensión o en qué detalles conservan). En cada una mantén el lenguaje y el contenido "
+                "tan similares como sea posible, cumpliendo con la petición del estudiante.\n\n"
+                "Devuelve tu respuesta como un archivo JSON con una sola entrada llamada 'new_scenarios', "
+                f"que sea una lista con exactamente {variants} textos."
+            )
         return prompt_adaptation
 
 
@@ -286,4 +341,12 @@ class LLMConfig:
             "Conversación actual:\n{history}\nHuman: {input}\nAI:"
         )
 
-        return reflect_prompt
\ No newline at end of file
+        return reflect_prompt
+
+    # Antepone la experiencia externa (primera narrativa) a las plantillas de reflexión y ABCD
+    def with_experience(self, template, primer_porque):
+        return (
+            "Esta es la experiencia externa de la persona:\n\n"
+            f"< {primer_porque} >\n\nSé consistente con sus pronombres.\n\n"
+            f"{template}\n\n"
+        )
@@ -0,0 +1,208 @@
+# === REPORTE DE TAMAÑO DE PROMPTS POR ETAPA ===
+# Compila un TOML con LLMConfig, renderiza cada plantilla con historiales de ejemplo
+# y estima cuántos tokens se envían por etapa y por turno, proyectando cómo crecen
+# con la longitud de la conversación. Si se supera algún presupuesto de [budgets]
+# (o de --budget) termina con código 1, para usarlo como verificación en cambios de config.
+#
+# Uso:
+#   python prompt_budget.py config_natalia_v0.1_teachers.toml
+#   python prompt_budget.py nuevo_config.toml --turns 12 --budget questions=3500 --json reporte.json
+
+import argparse
+import json
+import sys
+
+from langchain_core.prompts import PromptTemplate
+
+from llm_config_espanol import LLMConfig
+
+# Tamaños típicos (en caracteres) de lo que escribe el usuario y de lo que se genera
+SAMPLE_ANSWER = (
+    "El último par de semanas he tenido que trabajar muchas horas después de mi horario, "
+    "le meto mucho tiempo a planear mis clases y siento que no es valorado."
+)
+SAMPLE_PREAMBLE = "Gracias por compartirlo, entiendo que ha sido pesado para ti."
+SAMPLE_REQUEST = "Hazla más breve y quita la parte de la directora."
+
+
+# === ESTIMACIÓN DE TOKENS ===
+# Usa tiktoken si está disponible (lo instala langchain-openai); si no, ~4 caracteres por token.
+def make_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        return "tiktoken/o200k_base", lambda text: len(encoding.encode(text))
+    except Exception:
+        return "heurística (caracteres/4)", lambda text: (len(text) + 3) // 4
+
+
+# === HISTORIALES DE EJEMPLO ===
+# Historial en el formato de ConversationBufferMemory: el bot hace cada pregunta
+# (con un preámbulo breve) y el usuario responde con una respuesta de tamaño típico.
+def chat_history(intro, questions, turns):
+    lines = [f"AI: {intro}"]
+    for t in range(turns):
+        lines.append(f"Human: {SAMPLE_ANSWER}")
+        lines.append(f"AI: {SAMPLE_PREAMBLE} **{questions[t % len(questions)]}**")
+    return "\n".join(lines)
+
+
+# Historial "HUMAN: ...\nAI: ..." que se usa para generar narrativas (ver session_store.history_text)
+def summary_history(intro, questions, turns):
+    return chat_history(intro, questions, turns).replace("Human: ", "HUMAN: ")
+
+
+def render(template, **values):
+    return PromptTemplate.from_template(template).format(**values)
+
+
+# Renderiza cada etapa para una conversación de `turns` turnos y devuelve {etapa: prompt}
+def render_stages(llm_prompts, turns):
+    scenario = llm_prompts.example_scenario
+    collection = llm_prompts.questions_prompt_template
+    questions = llm_prompts.questions
+    followups = [q for dim in llm_prompts.abcd_dims.values() for q in dim["followups"]]
+
+    stages = {
+        "questions": render(
+            collection,
+            history=chat_history(llm_prompts.questions_intro, questions, turns),
+            input=SAMPLE_ANSWER,
+        ),
+        "reflect": render(
+            llm_prompts.with_experience(llm_prompts.reflect_prompt_template, scenario),
+            history=chat_history(llm_prompts.reflect_intro, ["Listo"], turns),
+            input=SAMPLE_ANSWER,
+        ),
+    }
+
+    for dim, template, intro in [
+        ("atencion", llm_prompts.a_prompt_template, llm_prompts.a_intro),
+        ("bondad", llm_prompts.b_prompt_template, llm_prompts.b_intro),
+        ("claridad", llm_prompts.c_prompt_template, llm_prompts.c_intro),
+        ("direccion", llm_prompts.d_prompt_template, llm_prompts.d_intro),
+    ]:
+        stages[f"abcd.{dim}"] = render(
+            llm_prompts.with_experience(template, scenario),
+            history=chat_history(intro, llm_prompts.abcd_dims[dim]["followups"], turns),
+            input=SAMPLE_ANSWER,
+        )
+
+    # Generación de micronarrativas: una llamada por personalidad (se reporta la más grande)
+    history = summary_history(llm_prompts.questions_intro, questions, turns)
+    summary_input = {key: history for key in llm_prompts.summary_keys}
+    stages["micronarrativa"] = max(
+        (render(llm_prompts.main_prompt_template, persona=persona, one_shot=llm_prompts.one_shot,
+                end_prompt=llm_prompts.extraction_task, **summary_input)
+         for persona in llm_prompts.personas),
+        key=len,
+    )
+
+    # Mismo orden de combinación que en la app: si una clave de [summaries.questions] se llama
+    # igual que una variable de la plantilla (p. ej. "context"), gana el historial.
+    joined = summary_history(llm_prompts.reflect_intro, followups, turns)
+    stages["segundo_porque"] = max(
+        (render(llm_prompts.second_why_prompt, **{
+            "persona": persona,
+            "one_shot": llm_prompts.one_shot,
+            "context": scenario,
+            **{key: joined for key in llm_prompts.summary_keys}
+        }) for persona in llm_prompts.personas),
+        key=len,
+    )
+
+    # Modo exprés: peor caso, todas las respuestas del formulario se consideran breves
+    answers = "\n".join(f"Pregunta: {q}\nRespuesta: {SAMPLE_ANSWER}" for q in llm_prompts.questions)
+    stages["seguimiento"] = render(
+        llm_prompts.express_followup_prompt_template, answers=answers, thin_answers=answers
+    )
+
+    stages["adaptacion"] = render(
+        llm_prompts.extraction_adaptation_prompt_template, scenario=scenario, input=SAMPLE_REQUEST
+    )
+    return stages
+
+
+# Tokens por etapa para cada número de turnos 1..max_turns, con ajuste lineal
+# tokens(t) ≈ base + por_turno * t y total acumulado (cada turno reenvía todo el historial).
+def build_report(llm_prompts, max_turns, count):
+    per_turn = {}
+    for t in range(1, max_turns + 1):
+        for stage, prompt in render_stages(llm_prompts, t).items():
+            per_turn.setdefault(stage, []).append(count(prompt))
+
+    report = {}
+    for stage, tokens in per_turn.items():
+        growth = (tokens[-1] - tokens[0]) / (max_turns - 1) if max_turns > 1 else 0.0
+        report[stage] = {
+            "base": round(tokens[0] - growth),
+            "per_turn": round(growth, 1),
+            "at_turn": tokens,
+            "last": tokens[-1],
+            "cumulative": sum(tokens),
+        }
+    return report
+
+
+def check_budgets(report, budgets):
+    exceeded = []
+    for stage, limit in budgets.items():
+        # Un presupuesto para "abcd" aplica a las cuatro dimensiones
+        matches = [s for s in report if s == stage or s.startswith(stage + ".")]
+        if not matches:
+            print(f"⚠️  Presupuesto para una etapa desconocida: {stage}", file=sys.stderr)
+        for s in matches:
+            if report[s]["last"] > limit:
+                exceeded.append(f"{s}: {report[s]['last']} tokens > presupuesto {limit}")
+    return exceeded
+
+
+def print_report(report, max_turns, counter_name):
+    print(f"Estimación: {counter_name}; proyección a {max_turns} turnos\n")
+    print(f"{'etapa':<20}{'base':>8}{'+/turno':>9}{'turno 1':>9}{f'turno {max_turns}':>10}{'acumulado':>11}")
+    for stage, r in report.items():
+        print(f"{stage:<20}{r['base']:>8}{r['per_turn']:>9}{r['at_turn'][0]:>9}{r['last']:>10}{r['cumulative']:>11}")
+
+
+def parse_budget(value):
+    stage, _, tokens = value.partition("=")
+    if not tokens.isdigit():
+        raise argparse.ArgumentTypeError(f"Formato esperado etapa=tokens, no {value!r}")
+    return stage, int(tokens)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reporte de tokens por etapa para las plantillas de un TOML.")
+    parser.add_argument("config", help="Archivo TOML a compilar")
+    parser.add_argument("--turns", type=int, help="Turnos de conversación a proyectar (por defecto [budgets].turns u 8)")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[],
+                        help="Presupuesto etapa=tokens (se puede repetir; reemplaza al del TOML)")
+    parser.add_argument("--json", help="Guarda el reporte completo en este archivo")
+    args = parser.parse_args(argv)
+
+    llm_prompts = LLMConfig(args.config)
+    budgets = {k: v for k, v in llm_prompts.budgets.items() if k != "turns"}
+    budgets.update(dict(args.budget))
+    max_turns = args.turns or llm_prompts.budgets.get("turns", 8)
+
+    counter_name, count = make_counter()
+    report = build_report(llm_prompts, max_turns, count)
+    print_report(report, max_turns, counter_name)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"estimator": counter_name, "turns": max_turns, "budgets": budgets, "stages": report}, f, indent=2)
+
+    exceeded = check_budgets(report, budgets)
+    if exceeded:
+        print("\n❌ Presupuestos excedidos:")
+        for line in exceeded:
+            print(f"  - {line}")
+        return 1
+    if budgets:
+        print("\n✅ Todas las etapas dentro de presupuesto.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
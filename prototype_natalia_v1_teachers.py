@@ -6,7 +6,6 @@ st.image("atentamente_logo.svg")  # Muestra logo del proyecto
 
 import os
 import sys
-from langchain_community.chat_message_histories import StreamlitChatMessageHistory
 from langchain.memory.buffer import ConversationBufferMemory
 from langchain_core.prompts import PromptTemplate
 from langchain.chains import LLMChain
@@ -16,7 +15,21 @@ from langsmith import Client
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
+import uuid
 from llm_config_espanol import LLMConfig  # Maneja configuración de prompts desde TOML
+from session_store import (  # Estado de sesión compacto y acotado
+    CompactChatMessageHistory, capped_append, history_text, render_memory_readout, MAX_ADAPTACIONES, MAX_CARACTERES
+)
+from transcript_store import get_transcript_worksheet, save_transcripts, summary_row  # Transcripciones comprimidas por sesión
+from input_filter import InputFilter  # Respuestas locales a entradas vacías, repetidas o fuera de tema
+from http_pool import http_client_from_secrets, render_pool_stats  # Conexiones HTTP compartidas entre sesiones
+from idempotency import has_result, mark_delivered, request_key, run_once, turn_key  # Evita llamadas y guardados duplicados (doble clic, reenvíos)
+from llm_cassette import cassette_from_settings, with_cassette  # Grabación/reproducción de llamadas al LLM
+import rerun_profiler  # Perfilado bajo demanda de reruns (sólo operadores)
+import background_jobs  # Generaciones largas en un pool del proceso, sobreviven a los reruns
+
+# === PERFILADO DEL RERUN (sólo si un operador lo activa) ===
+profiler = rerun_profiler.maybe_start(st.secrets, st.query_params, st.session_state, __file__)
 
 # === CARGA DE VARIABLES DE ENTORNO DESDE STREAMLIT SECRETS ===
 os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
@@ -33,15 +46,22 @@ scope = [
 credentials = ServiceAccountCredentials.from_json_keyfile_dict(
     st.secrets["gcp_service_account"], scope
 )
-gs_client = gspread.authorize(credentials)
 
 # Verifica si la hoja existe, si falla detiene la app
 try:
-    sheet = gs_client.open("micronarrativas_atentamenteBot").sheet1
+    with rerun_profiler.span("sheets:open"):
+        gs_client = gspread.authorize(credentials)
+        spreadsheet = gs_client.open("micronarrativas_atentamenteBot")
+        sheet = spreadsheet.sheet1
 except Exception as e:
     st.error(f"❌ No se pudo abrir la hoja de cálculo: {e}")
     st.stop()
 
+# La hoja de transcripciones se busca (o crea) una sola vez por proceso, no en cada guardado
+@st.cache_resource
+def transcript_worksheet(_spreadsheet):
+    return get_transcript_worksheet(_spreadsheet)
+
 # === CARGA DE ESTILOS CSS PERSONALIZADOS ===
 def load_custom_css(path="style.css"):
     with open(path, "r", encoding="utf-8") as f:
@@ -53,6 +73,7 @@ load_custom_css()
 input_args = sys.argv[1:]
 config_file = input_args[0] if input_args else st.secrets.get("CONFIG_FILE", "config_natalia_v0.1_teachers.toml")
 llm_prompts = LLMConfig(config_file)  # Carga prompts, plantillas y personalidades desde TOML
+prefilter = InputFilter(llm_prompts.prefilter, llm_prompts.prefilter_seed)
 
 smith_client = Client()  # Cliente para LangSmith (trazabilidad y debugging)
 
@@ -60,6 +81,7 @@ smith_client = Client()  # Cliente para LangSmith (trazabilidad y debugging)
 def init_session():
     defaults = {
         'run_id': None,
+        'session_id': uuid.uuid4().hex,  # Referencia de la sesión entre la fila de resumen y sus transcripciones
         'agentState': 'start',        # Estado de la conversación (start → chat → select_micronarrative → summarise1 → reflect → sliders → abcd → summarise2 → end)
         'consent': False,             # Controla si el usuario aceptó el consentimiento
         'summarise1': False,
@@ -77,6 +99,7 @@ def init_session():
         'vista_final': False,         # Determina si ya se muestra la narrativa final
         'ai_used': False,             # Permite mostrar o no el chat input del recuadro de mejora con IA
         'ai_used2': False,             # Permite mostrar o no el chat input del recuadro de mejora con IA
+        'express_followups': [],      # Preguntas de seguimiento pendientes en el modo exprés
         'abcd_tie_options': [],
         'await_pick_top': False,
         'abcd_top': "atencion",
@@ -88,6 +111,13 @@ def init_session():
 
 init_session()
 
+if profiler is not None:
+    profiler.tag(session_id=st.session_state.session_id, agentState=st.session_state.agentState)
+
+# Lectura de memoria por sesión, sólo si se activa en los secrets
+if st.secrets.get("DEBUG_MEMORY", False):
+    render_memory_readout()
+
 # ==== LAYOUT ESTABLE: pre-monta contenedores en orden fijo ====
 if not st.session_state.vista_final:
     slots = {}
@@ -101,22 +131,198 @@ if not st.session_state.vista_final:
 # === CONFIGURACIÓN DE LLM Y MEMORIA DE CONVERSACIÓN ===
 openai_api_key = st.secrets["OPENAI_API_KEY"]
 
-msgs_questions = StreamlitChatMessageHistory(key="langchain_messages")  # Historial de mensajes para LangChain
+msgs_questions = CompactChatMessageHistory(key="langchain_messages")  # Historial de mensajes para LangChain
 memory_questions = ConversationBufferMemory(
     memory_key="history", input_key="input", chat_memory=msgs_questions
 )
 
-msgs_reflect = StreamlitChatMessageHistory(key="reflect_messages")
+msgs_reflect = CompactChatMessageHistory(key="reflect_messages")
 memory_reflect = ConversationBufferMemory(
     memory_key="history", input_key="input", chat_memory=msgs_reflect
 )
 
-msgs_abcd = StreamlitChatMessageHistory(key="abcd_messages")
+msgs_abcd = CompactChatMessageHistory(key="abcd_messages")
 memory_abcd = ConversationBufferMemory(
     memory_key="history", input_key="input", chat_memory=msgs_abcd
 )
 
-chat = ChatOpenAI(temperature=0.3, model=st.session_state.llm_model, openai_api_key=openai_api_key)
+# Todas las sesiones comparten el mismo pool de conexiones (keep-alive) hacia la API
+http_client = http_client_from_secrets(st.secrets)
+if st.secrets.get("DEBUG_HTTP_POOL", False):
+    render_pool_stats(http_client)
+
+# El timeout se pasa también a ChatOpenAI: openai lo manda en cada petición y, si es None,
+# reemplaza al del cliente httpx
+chat = ChatOpenAI(temperature=0.3, model=st.session_state.llm_model, openai_api_key=openai_api_key,
+                  http_client=http_client, timeout=http_client.timeout)
+
+# Modo record/replay (LLM_CASSETTE_MODE): un cassette por sesión, se conserva entre reruns
+if "llm_cassette" not in st.session_state:
+    st.session_state.llm_cassette = cassette_from_settings(st.secrets, st.session_state.session_id)
+chat = with_cassette(chat, st.session_state.llm_cassette)
+if st.session_state.llm_cassette is not None and st.session_state.llm_cassette.mismatches:
+    st.sidebar.warning(f"⚠️ {len(st.session_state.llm_cassette.mismatches)} prompt(s) no coinciden con el cassette")
+
+# === TRABAJOS DE GENERACIÓN EN SEGUNDO PLANO ===
+# Corren en el pool de background_jobs: reciben texto ya preparado y no tocan st.session_state.
+
+# Genera una micronarrativa por cada personalidad definida en TOML
+# (las ya generadas en un intento anterior llegan en `partial` y no se repiten)
+def generate_micronarratives(full_history, report, partial):
+    chain = PromptTemplate.from_template(llm_prompts.main_prompt_template) | chat | SimpleJsonOutputParser()
+    summary_input = {key: full_history for key in llm_prompts.summary_keys}
+    for idx in range(len(partial), len(llm_prompts.personas)):
+        with rerun_profiler.span(f"micronarrativa:{idx}"):
+            result = chain.invoke({
+                "persona": llm_prompts.personas[idx],
+                "one_shot": llm_prompts.one_shot,
+                "end_prompt": llm_prompts.extraction_task,
+                **summary_input
+            })
+        partial.append(result['output_scenario'])
+        report(len(partial))
+    return list(partial)
+
+# Genera la segunda narrativa con la misma personalidad elegida previamente (un solo paso)
+def generate_second_why(full_history, persona_idx, context, report, partial):
+    chain = PromptTemplate.from_template(llm_prompts.second_why_prompt) | chat | SimpleJsonOutputParser()
+    summary_input = {key: full_history for key in llm_prompts.summary_keys}
+    with rerun_profiler.span("segundo_porque"):
+        result = chain.invoke({
+            "persona": llm_prompts.personas[persona_idx],
+            "one_shot": llm_prompts.one_shot,
+            "context": context,
+            **summary_input
+        })
+    report(1)
+    return result['output_scenario'].replace("\n", " ")
+
+def start_micronarratives_job():
+    full_history = history_text(msgs_questions)
+    background_jobs.submit("micronarrativas", request_key("micronarrativas", full_history),
+                           generate_micronarratives, full_history, total=len(llm_prompts.personas))
+
+def start_second_why_job():
+    # Reflexión + ABCD se referencian directamente, sin copiarlos a otro historial
+    full_history = history_text(msgs_reflect, msgs_abcd)
+    persona_idx = st.session_state.persona_elegida_idx
+    background_jobs.submit("segundo_porque", request_key("segundo_porque", persona_idx, full_history),
+                           generate_second_why, full_history, persona_idx, st.session_state.primer_porque)
+
+# === MODO EXPRÉS: FORMULARIO DE PREGUNTAS ===
+# Guarda las respuestas como pares pregunta/respuesta en el historial de preguntas,
+# para que la generación y las transcripciones las usen igual que las del chat
+def add_express_answers(pairs):
+    for question, answer in pairs:
+        if answer:
+            msgs_questions.add_ai_message(f"**{question}**")
+            msgs_questions.add_user_message(answer)
+
+# Una sola llamada al LLM que pide ampliar las respuestas con menos de express_min_chars;
+# si todas son suficientes (o el seguimiento está desactivado) no se llama al LLM
+def request_express_followups(pairs):
+    thin = [(q, a) for q, a in pairs if len(a) < llm_prompts.express_min_chars]
+    if not thin or not llm_prompts.express_followup:
+        return []
+
+    def as_text(items):
+        return "\n".join(f"Pregunta: {q}\nRespuesta: {a or '(sin respuesta)'}" for q, a in items)
+
+    # Sólo se acepta una lista de textos; cualquier otra forma de respuesta cuenta como "sin seguimiento"
+    def parse(result):
+        followups = result.get("followups") if isinstance(result, dict) else None
+        if not isinstance(followups, list) or not all(isinstance(f, str) for f in followups):
+            return []
+        return [f.strip() for f in followups if f.strip()][:len(thin)]
+
+    chain = PromptTemplate.from_template(llm_prompts.express_followup_prompt_template) | chat | SimpleJsonOutputParser()
+    try:
+        with st.spinner("💭 Revisando tus respuestas..."):
+            return run_once(
+                request_key("seguimiento", pairs),
+                lambda: parse(chain.invoke({"answers": as_text(pairs), "thin_answers": as_text(thin)}))
+            )
+    except Exception:
+        return []  # El seguimiento es opcional: si falla se generan las narrativas con lo que hay
+
+def render_express_form():
+    # Respuestas ya completas: sólo falta lanzar la generación
+    if msgs_questions.records and not st.session_state.express_followups:
+        start_micronarratives_job()
+        st.rerun()
+
+    if not msgs_questions.records:
+        st.markdown(llm_prompts.express_intro)
+        form_key, questions = "express_form", llm_prompts.questions
+    else:
+        st.markdown("Gracias por tus respuestas. Para entender mejor tu situación, **¿me puedes contar un poco más?**")
+        form_key, questions = "express_followup_form", st.session_state.express_followups
+
+    with st.form(form_key):
+        answers = [st.text_area(question, key=f"{form_key}_{idx}", max_chars=MAX_CARACTERES) for idx, question in enumerate(questions)]
+        submitted = st.form_submit_button("Enviar respuestas")
+    if not submitted:
+        return
+
+    pairs = [(question, answer.strip()) for question, answer in zip(questions, answers)]
+    if form_key == "express_form":
+        if not any(answer for _, answer in pairs):
+            st.warning("Responde al menos una pregunta para continuar.")
+            return
+        st.session_state.express_followups = request_express_followups(pairs)
+    else:
+        st.session_state.express_followups = []
+    add_express_answers(pairs)
+    st.rerun()
+
+# Entrada de un chat con el largo acotado. Si el historial llegó a su tope de mensajes ya no se
+# aceptan más (el historial se guarda completo, no se recorta): se avisa y se ofrece continuar.
+def bounded_chat_input(history, on_limit):
+    if not history.full:
+        return st.chat_input("Escribe aquí", max_chars=MAX_CARACTERES)
+    st.info("Llegamos al límite de mensajes de esta conversación. Con lo que ya compartiste podemos continuar.")
+    if st.button("Continuar ➡️", key=f"limite_{history.key}"):
+        on_limit()
+        st.rerun()
+    return None
+
+def continue_to_sliders():
+    st.session_state.sliders = True
+    st.session_state.agentState = "sliders"
+
+# Texto que acompaña cada versión sugerida en los subchats de mejora con IA
+def adaptation_ai_message(scenario):
+    return (f"**Versión sugerida:**\n\n> {scenario}\n\n"
+            "Si ya ves bien esta versión, **guárdala con el botón de abajo**.\n\n"
+            "Si no, puedes seguir editando con IA o manualmente con el cuadro de texto de abajo.")
+
+# Normaliza la respuesta de adaptación a una lista de versiones: 'new_scenarios' si es una lista
+# de textos; si no, 'new_scenario'. Con una respuesta inesperada devuelve una lista vacía.
+def adaptation_options(result):
+    if not isinstance(result, dict):
+        return []
+    options = result.get("new_scenarios")
+    if not isinstance(options, list) or not all(isinstance(o, str) for o in options):
+        options = [result.get("new_scenario")]
+    options = [o.replace("\n", " ").strip() for o in options if isinstance(o, str) and o.strip()]
+    return options[:llm_prompts.adaptation_variants]
+
+# Muestra lado a lado las versiones alternativas pendientes, con un botón para elegir cada una
+def render_adaptation_variants(suffix):
+    variants = st.session_state.get(f"adaptation_variants{suffix}", [])
+    if not variants:
+        return
+    st.markdown("**Elige la versión que más te guste:**")
+    cols = st.columns(len(variants))
+    for idx, (col, texto) in enumerate(zip(cols, variants)):
+        with col:
+            st.markdown(f"**Versión {idx + 1}**")
+            st.markdown(f"> {texto}")
+            if st.button("Elegir esta versión", key=f"variante{suffix}_{idx}"):
+                st.session_state[f"adapted_response{suffix}"] = texto
+                capped_append(st.session_state[f"adaptation_messages{suffix}"], "ai", texto, MAX_ADAPTACIONES)
+                st.session_state[f"adaptation_variants{suffix}"] = []
+                st.rerun()
 
 # === FLUJO: PANTALLA DE CONSENTIMIENTO ===
 if not st.session_state.consent:
@@ -183,18 +389,44 @@ if not st.session_state.vista_final:
     with slots["top"]:
         # === FLUJO: MOSTRAR HISTORIAL DE CONVERSACIÓN ===
         entry_messages_questions = st.expander("🗣️ Tus experiencias", expanded=st.session_state['exp_data'])
-        if not msgs_questions.messages:
+        if not msgs_questions.messages and not llm_prompts.express:
                 msgs_questions.add_ai_message(llm_prompts.questions_intro)  # Primer mensaje del bot
         with entry_messages_questions:
             for m in msgs_questions.messages:
                 with st.chat_message(m.type):
                     st.markdown(f"<span style='color:black'>{m.content}</span>", unsafe_allow_html=True)
 
-        if not st.session_state.agentState in ("select_micronarrative", "summarise1", "reflect", "sliders", "abcd", "summarise2"):
-            prompt_questions = st.chat_input("Escribe aquí")
+        # === GENERACIÓN DE MICRONARRATIVAS (en segundo plano) ===
+        micronarrativas_job = background_jobs.status("micronarrativas")
+        if micronarrativas_job == "running":
+            background_jobs.progress("micronarrativas", "Generando narrativas")
+        elif micronarrativas_job == "error":
+            st.error("❌ No se pudieron generar las narrativas.")
+            if st.button("Reintentar", key="retry_micronarrativas"):
+                if not background_jobs.retry("micronarrativas"):
+                    background_jobs.discard("micronarrativas")
+                    start_micronarratives_job()
+                st.rerun()
+        elif micronarrativas_job == "done":
+            # Guarda narrativas y cambia de estado
+            st.session_state.micronarrativas = background_jobs.collect("micronarrativas")
+            st.session_state.agentState = "select_micronarrative"
+            st.rerun()
+
+        collecting = micronarrativas_job is None and not st.session_state.agentState in ("select_micronarrative", "summarise1", "reflect", "sliders", "abcd", "summarise2")
+        if collecting and llm_prompts.express:
+            render_express_form()  # Modo exprés: formulario en lugar del chat pregunta por pregunta
+        elif collecting:
+            prompt_questions = bounded_chat_input(msgs_questions, start_micronarratives_job)
+            if prompt_questions and prefilter.handle(prompt_questions, msgs_questions, "collection"):
+                st.rerun()  # Respondido con plantilla, sin llamar al LLM
             if prompt_questions:
+                # Llave con el historial de antes del turno; un reenvío ya respondido no se vuelve a mostrar
+                turn = turn_key("questions", prompt_questions, len(msgs_questions.records))
+                answered = has_result(turn)
                 with entry_messages_questions:
-                    st.chat_message("human").markdown(f"<span style='color:black'>{prompt_questions}</span>", unsafe_allow_html=True)
+                    if not answered:
+                        st.chat_message("human").markdown(f"<span style='color:black'>{prompt_questions}</span>", unsafe_allow_html=True)
 
                     # Cadena principal del chat
                     conversation_questions = LLMChain(
@@ -209,39 +441,23 @@ if not st.session_state.vista_final:
 
                     # Genera respuesta del bot
                     with st.spinner("💭 Pensando..."):
-                        response = conversation_questions.invoke({"input": prompt_questions})
+                        response_text = run_once(
+                            turn,
+                            lambda: conversation_questions.invoke({"input": prompt_questions})["text"]
+                        )
 
-                    final_message = response['text']
+                    final_message = response_text
                     # Si llega el trigger "Gracias!" pasa a generación de micronarrativas
                     # if "Gracias!" in final_message:
                     #     final_message += " A continuación te voy a presentar 3 narrativas que pienso que describen tu situación, elige la narrativa que mejor describa tu experiencia. Ya que la hayas elegido, la podemos refinar."
 
-                    st.chat_message("ai").markdown(f"<span style='color:black'>{final_message}</span>", unsafe_allow_html=True)
+                    if not answered:
+                        st.chat_message("ai").markdown(f"<span style='color:black'>{final_message}</span>", unsafe_allow_html=True)
+                    mark_delivered("questions")
 
                     # === GENERACIÓN DE MICRONARRATIVAS ===
-                    if "Gracias!" in response['text']:
-                        summary_prompt = PromptTemplate.from_template(llm_prompts.main_prompt_template)
-                        parser = SimpleJsonOutputParser()
-                        chain = summary_prompt | chat | parser
-                        full_history = "\n".join([f"{m.type.upper()}: {m.content}" for m in msgs_questions.messages])
-                        summary_input = {key: full_history for key in llm_prompts.summary_keys}
-                        micronarrativas = []
-
-                        # Genera una narrativa por cada personalidad definida en TOML
-                        for persona in llm_prompts.personas:
-                            with st.spinner(f"💭 Generando narrativas"):
-                                result = chain.invoke({
-                                    "persona": persona,
-                                    "one_shot": llm_prompts.one_shot,
-                                    "end_prompt": llm_prompts.extraction_task,
-                                    **summary_input
-                                })
-                            micronarrativas.append(result['output_scenario'])
-
-                        # Guarda narrativas y cambia de estado
-                        st.session_state.micronarrativas = micronarrativas
-                        st.session_state.agentState = "select_micronarrative"
-
+                    if "Gracias!" in response_text:
+                        start_micronarratives_job()
                         st.rerun()
 
 
@@ -280,6 +496,7 @@ if not st.session_state.vista_final:
                     if st.button("Elegir versión", key=f"elegir_col_{idx}"):
                         st.session_state.persona_elegida_idx = idx
                         st.session_state.primer_porque = texto.replace("\n", " ")
+                        st.session_state.micronarrativas = []  # Ya no se muestran, libera memoria
                         st.session_state.summarise1 = True
                         st.session_state.agentState = "summarise1"
                         st.success("Narrativa seleccionada.")
@@ -308,15 +525,22 @@ if not st.session_state.vista_final:
                     st.session_state.adaptation_messages = []
 
                 # Mostrar historial de mejoras
+                # (los mensajes de la IA guardan sólo el escenario sugerido; el texto se arma al mostrar)
                 for m in st.session_state.adaptation_messages:
-                    with st.chat_message(m["role"]):
-                        st.markdown(m["content"])
+                    with st.chat_message(m.role):
+                        st.markdown(m.content if m.role == "human" else adaptation_ai_message(m.content))
+
+                render_adaptation_variants("")
 
-                adaptation_input = st.chat_input("Escribe cómo quieres mejorar tu narrativa...")
+                adaptation_input = st.chat_input("Escribe cómo quieres mejorar tu narrativa...", max_chars=MAX_CARACTERES)
                 if adaptation_input:
-                    st.session_state.adaptation_messages.append({"role": "human", "content": adaptation_input})
-                    with st.chat_message("human"):
-                        st.markdown(adaptation_input)
+                    # Llave con la versión de antes del turno; un reenvío ya respondido no se vuelve a agregar
+                    turn = turn_key("adaptacion", adaptation_input, st.session_state.adapted_response)
+                    answered = has_result(turn)
+                    if not answered:
+                        capped_append(st.session_state.adaptation_messages, "human", adaptation_input, MAX_ADAPTACIONES)
+                        with st.chat_message("human"):
+                            st.markdown(adaptation_input)
 
                     st.session_state.ai_used = True
                     # Prompt para adaptar narrativa sobre la última versión
@@ -328,21 +552,29 @@ if not st.session_state.vista_final:
                     chain = adaptation_prompt | chat | parser
 
                     with st.spinner("💭 Generando versión mejorada..."):
-                        improved = chain.invoke({
-                            "scenario": st.session_state.adapted_response,
-                            "input": adaptation_input
-                        })
-
-                    # Actualiza narrativa adaptada
-                    st.session_state.adapted_response = improved["new_scenario"]
-
-                    ai_message = (f"**Versión sugerida:**\n\n> {st.session_state.adapted_response}\n\n"
-                                    "Si ya ves bien esta versión, **guárdala con el botón de abajo**.\n\n"
-                                    "Si no, puedes seguir editando con IA o manualmente con el cuadro de texto de abajo.")
-                    st.session_state.adaptation_messages.append({"role": "ai", "content": ai_message})
-                    with st.chat_message("ai"):
-                        st.markdown(ai_message)
-                    st.rerun()
+                        improved = run_once(
+                            turn,
+                            lambda: adaptation_options(chain.invoke({
+                                "scenario": st.session_state.adapted_response,
+                                "input": adaptation_input
+                            }))
+                        )
+
+                    mark_delivered("adaptacion")
+
+                    if not improved:
+                        st.error("❌ No se pudo generar una versión mejorada. Intenta de nuevo con otra petición.")
+                    # Con varias versiones, se muestran lado a lado para elegir una
+                    elif len(improved) > 1:
+                        st.session_state.adaptation_variants = improved
+                        st.rerun()
+                    else:
+                        # Actualiza narrativa adaptada (salvo que el envío duplicado ya la haya agregado)
+                        st.session_state.adapted_response = improved[0]
+                        last = st.session_state.adaptation_messages[-1]
+                        if not (last.role == "ai" and last.content == improved[0]):
+                            capped_append(st.session_state.adaptation_messages, "ai", improved[0], MAX_ADAPTACIONES)
+                        st.rerun()
             
             st.markdown("\n\n\n\n")
             # Usuario puede editar la narrativa final
@@ -376,16 +608,18 @@ if not st.session_state.vista_final:
                         st.markdown(f"<span style='color:black'>{m.content}</span>", unsafe_allow_html=True)
 
             if st.session_state.agentState == "reflect":
-                prompt_reflect = st.chat_input("Escribe aquí")
+                prompt_reflect = bounded_chat_input(msgs_reflect, continue_to_sliders)
+                if prompt_reflect and prefilter.handle(prompt_reflect, msgs_reflect, "reflect"):
+                    st.rerun()  # Respondido con plantilla, sin llamar al LLM
                 if prompt_reflect:
+                    # Llave con el historial de antes del turno; un reenvío ya respondido no se vuelve a mostrar
+                    turn = turn_key("reflect", prompt_reflect, len(msgs_reflect.records))
+                    answered = has_result(turn)
                     with entry_messages_reflect:
-                        st.chat_message("human").markdown(f"<span style='color:black'>{prompt_reflect}</span>", unsafe_allow_html=True)
+                        if not answered:
+                            st.chat_message("human").markdown(f"<span style='color:black'>{prompt_reflect}</span>", unsafe_allow_html=True)
 
-                        reflect_prompt_complete = (
-                            "Esta es la experiencia externa de la persona:\n\n"
-                            f"< {st.session_state.primer_porque} >\n\nSé consistente con sus pronombres.\n\n"
-                            f"{llm_prompts.reflect_prompt_template}\n\n"
-                        )
+                        reflect_prompt_complete = llm_prompts.with_experience(llm_prompts.reflect_prompt_template, st.session_state.primer_porque)
 
                         # Cadena principal del chat
                         conversation_reflect = LLMChain(
@@ -400,14 +634,19 @@ if not st.session_state.vista_final:
 
                         # Genera respuesta del bot
                         with st.spinner("💭 Pensando..."):
-                            response = conversation_reflect.invoke({"input": prompt_reflect})
+                            response_text = run_once(
+                                turn,
+                                lambda: conversation_reflect.invoke({"input": prompt_reflect})["text"]
+                            )
 
-                        final_message = response['text']
+                        final_message = response_text
                         
-                        st.chat_message("ai").markdown(f"<span style='color:black'>{final_message}</span>", unsafe_allow_html=True)
+                        if not answered:
+                            st.chat_message("ai").markdown(f"<span style='color:black'>{final_message}</span>", unsafe_allow_html=True)
+                        mark_delivered("reflect")
 
                         # === GENERACIÓN DE SLIDERS ===
-                        if "Gracias!" in response['text']:
+                        if "Gracias!" in response_text:
                             # Cambia de estado
                             st.session_state.sliders = True
                             st.session_state.agentState = "sliders"
@@ -513,17 +752,37 @@ if not st.session_state.vista_final:
                         with st.expander("Si quieres ver algunas de las serpientes más comunes para recordarlas, aquí puedes verlas 👇", expanded=False):
                             st.markdown(llm_prompts.serpents)
 
-            if st.session_state.agentState == "abcd":
-                prompt_abcd = st.chat_input("Escribe aquí")
+            # === GENERACIÓN DE LA SEGUNDA NARRATIVA (en segundo plano) ===
+            segundo_porque_job = background_jobs.status("segundo_porque")
+            if segundo_porque_job == "running":
+                background_jobs.progress("segundo_porque", "Generando narrativa")
+            elif segundo_porque_job == "error":
+                st.error("❌ No se pudo generar la narrativa.")
+                if st.button("Reintentar", key="retry_segundo_porque"):
+                    if not background_jobs.retry("segundo_porque"):
+                        background_jobs.discard("segundo_porque")
+                        start_second_why_job()
+                    st.rerun()
+            elif segundo_porque_job == "done":
+                st.session_state.segundo_porque = background_jobs.collect("segundo_porque")
+                # Cambia de estado
+                st.session_state.summarise2 = True
+                st.session_state.agentState = "summarise2"
+                st.rerun()
+
+            if segundo_porque_job is None and st.session_state.agentState == "abcd":
+                prompt_abcd = bounded_chat_input(msgs_abcd, start_second_why_job)
+                if prompt_abcd and prefilter.handle(prompt_abcd, msgs_abcd, "abcd"):
+                    st.rerun()  # Respondido con plantilla, sin llamar al LLM
                 if prompt_abcd:
+                    # Llave con el historial de antes del turno; un reenvío ya respondido no se vuelve a mostrar
+                    turn = turn_key("abcd", prompt_abcd, len(msgs_abcd.records))
+                    answered = has_result(turn)
                     with entry_messages_abcd:
-                        st.chat_message("human").markdown(f"<span style='color:black'>{prompt_abcd}</span>", unsafe_allow_html=True)
+                        if not answered:
+                            st.chat_message("human").markdown(f"<span style='color:black'>{prompt_abcd}</span>", unsafe_allow_html=True)
 
-                        abcd_prompt_complete = (
-                            "Esta es la experiencia externa de la persona:\n\n"
-                            f"< {st.session_state.primer_porque} >\n\nSé consistente con sus pronombres.\n\n"
-                            f"{abcd_prompt_template}\n\n"
-                        )
+                        abcd_prompt_complete = llm_prompts.with_experience(abcd_prompt_template, st.session_state.primer_porque)
 
                         # Cadena principal del chat
                         conversation_abcd = LLMChain(
@@ -538,48 +797,22 @@ if not st.session_state.vista_final:
 
                         # Genera respuesta del bot
                         with st.spinner("💭 Pensando..."):
-                            response = conversation_abcd.invoke({"input": prompt_abcd})
+                            response_text = run_once(
+                                turn,
+                                lambda: conversation_abcd.invoke({"input": prompt_abcd})["text"]
+                            )
 
-                        final_message = response['text']
+                        final_message = response_text
                         # Si llega el trigger "Gracias!" pasa a generación de micronarrativas
                         if "Gracias!" in final_message:
                             final_message += llm_prompts.abcd_outro
-                        st.chat_message("ai").markdown(f"<span style='color:black'>{final_message}</span>", unsafe_allow_html=True)
+                        if not answered:
+                            st.chat_message("ai").markdown(f"<span style='color:black'>{final_message}</span>", unsafe_allow_html=True)
+                        mark_delivered("abcd")
 
                         # === GENERACIÓN DE MICRONARRATIVA ===
-                        if "Gracias!" in response['text']:
-                            msgs_joined = StreamlitChatMessageHistory(key="joined_messages")
-                            for m in msgs_reflect.messages:
-                                if m.type == "ai":
-                                    msgs_joined.add_ai_message(m.content)
-                                elif m.type == "human":
-                                    msgs_joined.add_user_message(m.content)
-                            for m in msgs_abcd.messages:
-                                if m.type == "ai":
-                                    msgs_joined.add_ai_message(m.content)
-                                elif m.type == "human":
-                                    msgs_joined.add_user_message(m.content)
-
-                            summary_prompt = PromptTemplate.from_template(llm_prompts.second_why_prompt)
-                            parser = SimpleJsonOutputParser()
-                            chain = summary_prompt | chat | parser
-                            full_history = "\n".join([f"{m.type.upper()}: {m.content}" for m in msgs_joined.messages])
-                            summary_input = {key: full_history for key in llm_prompts.summary_keys}
-
-                            # Genera una narrativa por la misma personalidad elegida previamente
-                            with st.spinner(f"💭 Generando narrativa"):
-                                result = chain.invoke({
-                                    "persona": llm_prompts.personas[st.session_state.persona_elegida_idx],
-                                    "one_shot": llm_prompts.one_shot,
-                                    "context": st.session_state.primer_porque,
-                                    **summary_input
-                                })
-                            st.session_state.segundo_porque = result['output_scenario'].replace("\n", " ")
-                            # Cambia de estado
-                            #st.session_state.vista_final = True
-                            st.session_state.summarise2 = True
-                            st.session_state.agentState = "summarise2"
-
+                        if "Gracias!" in response_text:
+                            start_second_why_job()
                             st.rerun()
     
     # === FLUJO: RESUMEN Y EDICIÓN 2 ===
@@ -606,15 +839,22 @@ if not st.session_state.vista_final:
                     st.session_state.adaptation_messages2 = []
 
                 # Mostrar historial de mejoras
+                # (los mensajes de la IA guardan sólo el escenario sugerido; el texto se arma al mostrar)
                 for m in st.session_state.adaptation_messages2:
-                    with st.chat_message(m["role"]):
-                        st.markdown(m["content"])
+                    with st.chat_message(m.role):
+                        st.markdown(m.content if m.role == "human" else adaptation_ai_message(m.content))
+
+                render_adaptation_variants("2")
 
-                adaptation_input2 = st.chat_input("Escribe cómo quieres mejorar tu reflexión...")
+                adaptation_input2 = st.chat_input("Escribe cómo quieres mejorar tu reflexión...", max_chars=MAX_CARACTERES)
                 if adaptation_input2:
-                    st.session_state.adaptation_messages2.append({"role": "human", "content": adaptation_input2})
-                    with st.chat_message("human"):
-                        st.markdown(adaptation_input2)
+                    # Llave con la versión de antes del turno; un reenvío ya respondido no se vuelve a agregar
+                    turn = turn_key("adaptacion2", adaptation_input2, st.session_state.adapted_response2)
+                    answered = has_result(turn)
+                    if not answered:
+                        capped_append(st.session_state.adaptation_messages2, "human", adaptation_input2, MAX_ADAPTACIONES)
+                        with st.chat_message("human"):
+                            st.markdown(adaptation_input2)
 
                     st.session_state.ai_used2 = True
                     # Prompt para adaptar narrativa sobre la última versión
@@ -626,21 +866,29 @@ if not st.session_state.vista_final:
                     chain = adaptation_prompt | chat | parser
 
                     with st.spinner("💭 Generando versión mejorada..."):
-                        improved = chain.invoke({
-                            "scenario": st.session_state.adapted_response2,
-                            "input": adaptation_input2
-                        })
-
-                    # Actualiza narrativa adaptada
-                    st.session_state.adapted_response2 = improved["new_scenario"]
-
-                    ai_message = (f"**Versión sugerida:**\n\n> {st.session_state.adapted_response2}\n\n"
-                                    "Si ya ves bien esta versión, **guárdala con el botón de abajo**.\n\n"
-                                    "Si no, puedes seguir editando con IA o manualmente con el cuadro de texto de abajo.")
-                    st.session_state.adaptation_messages2.append({"role": "ai", "content": ai_message})
-                    with st.chat_message("ai"):
-                        st.markdown(ai_message)
-                    st.rerun()
+                        improved = run_once(
+                            turn,
+                            lambda: adaptation_options(chain.invoke({
+                                "scenario": st.session_state.adapted_response2,
+                                "input": adaptation_input2
+                            }))
+                        )
+
+                    mark_delivered("adaptacion2")
+
+                    if not improved:
+                        st.error("❌ No se pudo generar una versión mejorada. Intenta de nuevo con otra petición.")
+                    # Con varias versiones, se muestran lado a lado para elegir una
+                    elif len(improved) > 1:
+                        st.session_state.adaptation_variants2 = improved
+                        st.rerun()
+                    else:
+                        # Actualiza narrativa adaptada (salvo que el envío duplicado ya la haya agregado)
+                        st.session_state.adapted_response2 = improved[0]
+                        last = st.session_state.adaptation_messages2[-1]
+                        if not (last.role == "ai" and last.content == improved[0]):
+                            capped_append(st.session_state.adaptation_messages2, "ai", improved[0], MAX_ADAPTACIONES)
+                        st.rerun()
             
             st.markdown("\n\n\n\n")
             # Usuario puede editar la narrativa final
@@ -658,17 +906,22 @@ if not st.session_state.vista_final:
                     new_text = st.session_state.adapted_response2
                 st.session_state.segundo_porque = new_text.replace("\n", " ")
 
-                history_text_questions = "\n".join(f"{m.type.upper()}: {m.content}" for m in msgs_questions.messages)
-                history_text_reflect = "\n".join(f"{m.type.upper()}: {m.content}" for m in msgs_reflect.messages)
-                history_text_abcd = "\n".join(f"{m.type.upper()}: {m.content}" for m in msgs_abcd.messages)
-
+                # Las transcripciones van comprimidas a su propia hoja; la fila de resumen sólo guarda el id
+                def save_session():
+                    save_transcripts(transcript_worksheet(spreadsheet), st.session_state.session_id, {
+                        "questions": msgs_questions,
+                        "reflect": msgs_reflect,
+                        "abcd": msgs_abcd,
+                    })
+                    sheet.append_row(summary_row(datetime.now().isoformat(),
+                                                 st.session_state.primer_porque,
+                                                 st.session_state.segundo_porque,
+                                                 st.session_state.session_id))
+                    return True
+
+                # Una sola fila por sesión aunque el botón se presione dos veces
                 try:
-                    sheet.append_row([datetime.now().isoformat(),
-                                      st.session_state.primer_porque,
-                                      st.session_state.segundo_porque,
-                                      history_text_questions,
-                                      history_text_reflect,
-                                      history_text_abcd])
+                    run_once(request_key("guardar_final"), save_session)
                 except Exception as e:
                     st.error(f"❌ Error al guardar en Google Sheets: {e}")
                 
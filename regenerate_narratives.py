@@ -0,0 +1,255 @@
+# === REGENERACIÓN DE NARRATIVAS EN LOTE A PARTIR DE TRANSCRIPCIONES GUARDADAS ===
+# Vuelve a generar las narrativas de sesiones pasadas con los prompts de un TOML
+# (por ejemplo, después de editar [summaries.personas] o [example]) y escribe los
+# resultados junto a los originales para compararlos.
+#
+# - Las llamadas al LLM corren en paralelo con un límite de concurrencia (--concurrency).
+# - El archivo de salida funciona como checkpoint: al reanudar se saltan las sesiones
+#   que ya tienen resultado. Al terminar queda una sola línea por sesión (la más reciente).
+# - --base-url permite apuntar a un servidor local compatible con OpenAI (stub para pruebas).
+#
+# Uso:
+#   python regenerate_narratives.py --input sesiones.jsonl --output comparacion.jsonl
+#   python regenerate_narratives.py --sheet micronarrativas_atentamenteBot --credentials sa.json \
+#       --output comparacion.jsonl --config nuevo_config.toml --concurrency 8
+#
+# Formato de --input (una sesión por línea, igual al que devuelve transcript_store):
+#   {"session_id": "...", "primer_porque": "...", "segundo_porque": "...",
+#    "transcripts": {"questions": [{"role": "ai", "content": "..."}, ...], "reflect": [...], "abcd": [...]}}
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from langchain_core.prompts import PromptTemplate
+from langchain_openai import ChatOpenAI
+from langchain.output_parsers.json import SimpleJsonOutputParser
+
+from llm_config_espanol import LLMConfig
+
+DEFAULT_CONFIG = "config_natalia_v0.1_teachers.toml"
+
+
+# Mismo formato de historial que usa la app al generar las narrativas
+def transcript_text(*transcripts):
+    return "\n".join(
+        f"{m['role'].upper()}: {m['content']}"
+        for transcript in transcripts
+        for m in transcript
+    )
+
+
+# === LECTURA DE SESIONES ===
+def read_jsonl_sessions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Lee las filas de resumen y las transcripciones guardadas en Google Sheets
+def read_sheet_sessions(sheet_name, credentials_file):
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+    from transcript_store import TRANSCRIPTS_WORKSHEET, assemble_transcripts, parse_summary_row
+
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    credentials = ServiceAccountCredentials.from_json_keyfile_name(credentials_file, scope)
+    spreadsheet = gspread.authorize(credentials).open(sheet_name)
+    transcript_rows = spreadsheet.worksheet(TRANSCRIPTS_WORKSHEET).get_all_values()
+
+    sessions = []
+    legacy = 0
+    for row in spreadsheet.sheet1.get_all_values():
+        summary = parse_summary_row(row)
+        if summary is None:
+            legacy += 1  # Encabezado o fila antigua con la transcripción en la columna D
+            continue
+        try:
+            transcripts = assemble_transcripts(transcript_rows, summary["session_id"])
+        except (KeyError, ValueError) as e:
+            print(f"⚠️  Se omite la sesión {summary['session_id']}: {e}", file=sys.stderr)
+            continue
+        sessions.append({
+            "session_id": summary["session_id"],
+            "primer_porque": summary["primer_porque"],
+            "segundo_porque": summary["segundo_porque"],
+            "transcripts": transcripts,
+        })
+    if legacy:
+        print(f"ℹ️  {legacy} fila(s) sin marca de formato (antiguas o encabezado) se omitieron", file=sys.stderr)
+    return sessions
+
+
+# Sesiones ya completadas en una corrida anterior (las que terminaron con error se reintentan).
+# Sólo se reanuda un archivo escrito con el mismo TOML y las mismas etapas: si no, una sesión
+# "hecha" con otros prompts se saltaría y el archivo mezclaría resultados de dos configuraciones.
+def read_checkpoint(path, config_file, stages):
+    done = set()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if (record.get("config"), record.get("stages")) != (config_file, stages):
+                        raise ValueError(
+                            f"{path} se escribió con --config {record.get('config')} y --stages {record.get('stages')}; "
+                            f"usa otro --output para --config {config_file} y --stages {stages}")
+                    if "error" not in record:
+                        done.add(record["session_id"])
+    return done
+
+
+# === GENERACIÓN ===
+class NarrativeRegenerator:
+
+    def __init__(self, llm_prompts, chat, concurrency, stages):
+        self.llm_prompts = llm_prompts
+        self.stages = stages
+        self.semaphore = asyncio.Semaphore(concurrency)
+        parser = SimpleJsonOutputParser()
+        self.first_chain = PromptTemplate.from_template(llm_prompts.main_prompt_template) | chat | parser
+        self.second_chain = PromptTemplate.from_template(llm_prompts.second_why_prompt) | chat | parser
+
+    # Una llamada al LLM, respetando el límite de concurrencia
+    async def invoke(self, chain, inputs):
+        async with self.semaphore:
+            result = await chain.ainvoke(inputs)
+        return result["output_scenario"].replace("\n", " ")
+
+    async def regenerate(self, session):
+        llm_prompts = self.llm_prompts
+        transcripts = session["transcripts"]
+        jobs = {}
+
+        # Primera narrativa: una por personalidad, igual que en la selección de la app
+        if "first" in self.stages:
+            full_history = transcript_text(transcripts.get("questions", []))
+            summary_input = {key: full_history for key in llm_prompts.summary_keys}
+            for name, persona in zip(llm_prompts.persona_names, llm_prompts.personas):
+                jobs[("primer_porque", name)] = self.invoke(self.first_chain, {
+                    "persona": persona,
+                    "one_shot": llm_prompts.one_shot,
+                    "end_prompt": llm_prompts.extraction_task,
+                    **summary_input
+                })
+
+        # Segunda narrativa: la personalidad elegida no se guarda, así que se generan todas
+        if "second" in self.stages:
+            full_history = transcript_text(transcripts.get("reflect", []), transcripts.get("abcd", []))
+            summary_input = {key: full_history for key in llm_prompts.summary_keys}
+            for name, persona in zip(llm_prompts.persona_names, llm_prompts.personas):
+                jobs[("segundo_porque", name)] = self.invoke(self.second_chain, {
+                    "persona": persona,
+                    "one_shot": llm_prompts.one_shot,
+                    "context": session.get("primer_porque", ""),
+                    **summary_input
+                })
+
+        results = await asyncio.gather(*jobs.values())
+        regenerated = {}
+        for (field, name), text in zip(jobs.keys(), results):
+            regenerated.setdefault(field, {})[name] = text
+
+        return {
+            "session_id": session["session_id"],
+            "original": {
+                "primer_porque": session.get("primer_porque"),
+                "segundo_porque": session.get("segundo_porque"),
+            },
+            "regenerated": regenerated,
+        }
+
+
+# Deja una sola línea por sesión, la última escrita: una sesión que falló y luego se
+# completó en otra corrida no aparece duplicada (con su error) al comparar resultados
+def compact_output(path):
+    records = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records.pop(record["session_id"], None)
+                records[record["session_id"]] = record
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records.values():
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+async def run(sessions, regenerator, output_path, config_file):
+    stages = ",".join(sorted(regenerator.stages))
+    done = read_checkpoint(output_path, config_file, stages)
+    pending = [s for s in sessions if s["session_id"] not in done]
+    print(f"{len(sessions)} sesiones, {len(done)} ya procesadas, {len(pending)} pendientes.")
+
+    async def process(session):
+        try:
+            record = await regenerator.regenerate(session)
+        except Exception as e:
+            record = {"session_id": session["session_id"], "error": f"{type(e).__name__}: {e}"}
+        record["config"] = config_file
+        record["stages"] = stages
+        return record
+
+    failed = 0
+    with open(output_path, "a", encoding="utf-8") as out:
+        tasks = [asyncio.create_task(process(s)) for s in pending]
+        for count, task in enumerate(asyncio.as_completed(tasks), start=1):
+            record = await task
+            # Se escribe y se guarda en disco en cuanto termina cada sesión (checkpoint)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if "error" in record:
+                failed += 1
+                print(f"❌ [{count}/{len(pending)}] {record['session_id']}: {record['error']}", file=sys.stderr)
+            else:
+                print(f"✅ [{count}/{len(pending)}] {record['session_id']}")
+    compact_output(output_path)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenera narrativas de sesiones guardadas con los prompts de un TOML.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Archivo JSONL con sesiones y transcripciones")
+    source.add_argument("--sheet", help="Nombre de la hoja de Google Sheets con las sesiones guardadas")
+    parser.add_argument("--credentials", help="JSON de la cuenta de servicio de Google (con --sheet)")
+    parser.add_argument("--output", required=True, help="Archivo JSONL de resultados (también sirve de checkpoint)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Archivo TOML con los prompts a probar")
+    parser.add_argument("--stages", default="first,second", help="Narrativas a regenerar: first, second o ambas")
+    parser.add_argument("--concurrency", type=int, default=4, help="Máximo de llamadas simultáneas al LLM")
+    parser.add_argument("--model", default="gpt-4.1-mini")
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"),
+                        help="URL de un servidor compatible con OpenAI (p. ej. un stub local)")
+    parser.add_argument("--limit", type=int, help="Procesar sólo las primeras N sesiones")
+    args = parser.parse_args(argv)
+
+    if args.sheet and not args.credentials:
+        parser.error("--sheet requiere --credentials")
+
+    sessions = read_jsonl_sessions(args.input) if args.input else read_sheet_sessions(args.sheet, args.credentials)
+    if args.limit:
+        sessions = sessions[:args.limit]
+
+    llm_prompts = LLMConfig(args.config)
+    chat = ChatOpenAI(
+        temperature=args.temperature,
+        model=args.model,
+        base_url=args.base_url,
+        openai_api_key=os.environ.get("OPENAI_API_KEY", "sk-local"),
+    )
+    stages = {s.strip() for s in args.stages.split(",") if s.strip()}
+    regenerator = NarrativeRegenerator(llm_prompts, chat, args.concurrency, stages)
+
+    try:
+        failed = asyncio.run(run(sessions, regenerator, args.output, args.config))
+    except ValueError as e:
+        parser.error(str(e))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
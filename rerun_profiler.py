@@ -0,0 +1,213 @@
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# === PERFILADO BAJO DEMANDA DE RERUNS EN VIVO ===
+# Sólo para operadores: se activa para una sesión con ?profile=<PROFILE_TOKEN> (y se apaga
+# con ?profile=off), o para todas con la variable de entorno NATALIA_PROFILE=1.
+# Un hilo muestrea la pila del hilo del script cada pocos milisegundos hasta que termina
+# el rerun (incluido st.stop()/st.rerun()) y deja en PROFILE_DIR:
+#   - <archivo>.collapsed  pilas en formato "colapsado" (flamegraph.pl, speedscope)
+#   - <archivo>.json       tiempos por función, spans de LLM/IO y agentState
+# Los trabajos en segundo plano lanzados durante un rerun perfilado corren en otro hilo y
+# terminan después del rerun; sus spans se guardan en un reporte propio (<archivo>_job-<nombre>.json).
+
+DEFAULT_INTERVAL_S = 0.005
+TOP_FUNCTIONS = 50
+
+_local = threading.local()  # Perfilador activo del hilo del script (o del trabajo en segundo plano)
+
+
+# Nombre base de los archivos de un reporte: fecha, sesión y agentState
+def _report_base(out_dir, tags):
+    state = tags.get("agentState", "unknown")
+    session = str(tags.get("session_id", "nosession"))[:8]
+    return os.path.join(out_dir, f"{datetime.now():%Y%m%d-%H%M%S-%f}_{session}_{state}")
+
+
+class RerunProfiler:
+
+    def __init__(self, script_path, out_dir, interval=DEFAULT_INTERVAL_S):
+        self.script_file = os.path.basename(script_path)
+        self.out_dir = out_dir
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.tags = {}
+        self.spans = []          # Spans terminados: nombre, inicio y duración en ms
+        self.active_spans = []   # Spans abiertos; se anteponen a las pilas muestreadas
+        self.stacks = Counter()
+        self.samples = 0
+        self.done = False
+        self.t0 = time.perf_counter()
+        self.module_frame = None  # Frame <module> de *este* rerun
+        self._sampler = threading.Thread(target=self._run, name="rerun-profiler", daemon=True)
+
+    # Debe llamarse desde el hilo del script. Streamlit ejecuta los reruns de st.rerun() uno
+    # tras otro en el mismo hilo, así que el muestreo termina cuando desaparece el frame
+    # <module> de este rerun (no cuando no queda ninguno, que casi nunca se observa).
+    def start(self):
+        frame = sys._getframe(1)
+        while frame is not None and not self._is_module(frame):
+            frame = frame.f_back
+        self.module_frame = frame
+        _local.profiler = self
+        self._sampler.start()
+        return self
+
+    def _is_module(self, frame):
+        code = frame.f_code
+        return code.co_name == "<module>" and os.path.basename(code.co_filename) == self.script_file
+
+    # Etiquetas que acompañan al reporte (session_id, agentState, ...)
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    # Pila del hilo del script desde el frame <module> de este rerun, o None si el rerun terminó
+    def _script_stack(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            if frame is self.module_frame:
+                return stack[::-1]
+            frame = frame.f_back
+        return None
+
+    def _run(self):
+        while True:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = self._script_stack(frame) if frame is not None else None
+            if stack is None:
+                break
+            spans = [f"[{name}]" for name in list(self.active_spans)]
+            self.stacks[";".join(spans + stack)] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        self.wall_s = time.perf_counter() - self.t0
+        self.module_frame = None
+        self.done = True
+        try:
+            self._write()
+        except OSError as e:
+            print(f"rerun_profiler: no se pudo escribir el perfil: {e}", file=sys.stderr)
+
+    # Tiempos por función a partir de las muestras (propio = en la cima de la pila)
+    def function_timings(self):
+        ms_per_sample = (self.wall_s * 1000 / self.samples) if self.samples else 0.0
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = [f for f in stack.split(";") if not f.startswith("[")]
+            if frames:
+                self_counts[frames[-1]] += count
+            for f in set(frames):
+                total_counts[f] += count
+        return [
+            {"function": f, "total_ms": round(n * ms_per_sample, 1), "self_ms": round(self_counts[f] * ms_per_sample, 1)}
+            for f, n in total_counts.most_common(TOP_FUNCTIONS)
+        ]
+
+    def _write(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        state = self.tags.get("agentState", "unknown")
+        base = _report_base(self.out_dir, self.tags)
+
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.items():
+                f.write(f"agentState={state};{stack} {count}\n")
+
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({
+                "tags": self.tags,
+                "wall_ms": round(self.wall_s * 1000, 1),
+                "samples": self.samples,
+                "interval_ms": self.interval * 1000,
+                "spans": self.spans,
+                "functions": self.function_timings(),
+            }, f, ensure_ascii=False, indent=2, default=str)
+
+
+# Spans de un trabajo en segundo plano (sin muestreo de pila: el hilo es del pool)
+class JobProfile:
+
+    def __init__(self, profiler, name):
+        self.out_dir = profiler.out_dir
+        self.tags = {**profiler.tags, "job": name}
+        self.spans = []
+        self.active_spans = []
+        self.t0 = time.perf_counter()
+
+    def write(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(f"{_report_base(self.out_dir, self.tags)}_job-{self.tags['job']}.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "tags": self.tags,
+                "wall_ms": round((time.perf_counter() - self.t0) * 1000, 1),
+                "spans": self.spans,
+            }, f, ensure_ascii=False, indent=2, default=str)
+
+
+def start_job(profiler, name):
+    _local.job = JobProfile(profiler, name)
+
+
+def finish_job():
+    job = getattr(_local, "job", None)
+    _local.job = None
+    if job is not None:
+        try:
+            job.write()
+        except OSError as e:
+            print(f"rerun_profiler: no se pudo escribir el perfil del trabajo: {e}", file=sys.stderr)
+
+
+# Decide si este rerun se perfila y, en ese caso, arranca el muestreo.
+# La activación por query param queda guardada en la sesión para los reruns siguientes.
+def maybe_start(settings, query_params, session_state, script_path):
+    token = settings.get("PROFILE_TOKEN")
+    requested = query_params.get("profile")
+    if token and requested is not None:
+        if requested == "off":
+            session_state["profiling"] = False
+        elif hmac.compare_digest(str(requested), str(token)):
+            session_state["profiling"] = True
+
+    enabled = session_state.get("profiling", False) or os.environ.get("NATALIA_PROFILE", "") in ("1", "true")
+    if not enabled:
+        _local.profiler = None
+        return None
+
+    out_dir = settings.get("PROFILE_DIR", os.environ.get("PROFILE_DIR", "profiles"))
+    interval = float(settings.get("PROFILE_INTERVAL_MS", 5)) / 1000
+    return RerunProfiler(script_path, out_dir, interval).start()
+
+
+def current():
+    profiler = getattr(_local, "profiler", None)
+    return profiler if profiler is not None and not profiler.done else None
+
+
+# Marca un tramo del rerun o del trabajo en segundo plano (llamada al LLM, Sheets, ...).
+# No hace nada si no se está perfilando.
+@contextmanager
+def span(name):
+    profiler = current() or getattr(_local, "job", None)
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    profiler.active_spans.append(name)
+    try:
+        yield
+    finally:
+        profiler.active_spans.remove(name)
+        profiler.spans.append({
+            "name": name,
+            "start_ms": round((start - profiler.t0) * 1000, 1),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
@@ -0,0 +1,111 @@
+import sys
+
+import streamlit as st
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+
+# === LÍMITES DEL ESTADO DE SESIÓN ===
+# Topes para que una sesión abierta (aunque esté inactiva) no crezca sin límite. Los historiales
+# de chat se guardan completos en las transcripciones, así que nunca se recortan: la entrada se
+# limita en el origen (max_chars) y, al llegar al tope de mensajes, la app ofrece continuar.
+MAX_MENSAJES = 120          # Mensajes por historial de chat
+MAX_CARACTERES = 4000       # Caracteres por mensaje que puede escribir el usuario
+MAX_ADAPTACIONES = 20       # Entradas por subchat de mejora con IA (sólo se muestran, no se guardan)
+
+
+# Registro compacto de un mensaje: sólo rol y contenido, sin diccionarios por instancia.
+class Mensaje:
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+
+    # Alias para mantener la misma interfaz que los mensajes de LangChain (m.type)
+    @property
+    def type(self):
+        return self.role
+
+
+# Agrega un registro a una lista que sólo se muestra (subchats de mejora con IA); si se excede
+# el tope se descartan los registros más antiguos. No usar con historiales que se guardan.
+def capped_append(records, role, content, max_entries):
+    records.append(Mensaje(role, content))
+    while len(records) > max_entries:
+        del records[0]
+
+
+# Historial de chat para LangChain que guarda cada mensaje una sola vez como `Mensaje`
+# dentro de st.session_state. Los objetos de LangChain se construyen sólo al leer.
+class CompactChatMessageHistory(BaseChatMessageHistory):
+
+    def __init__(self, key, max_mensajes=MAX_MENSAJES):
+        if key not in st.session_state:
+            st.session_state[key] = []
+        self.key = key
+        self.max_mensajes = max_mensajes
+        # Referencia directa a la lista para no volver a consultar st.session_state en cada acceso
+        self.records = st.session_state[key]
+
+    @property
+    def messages(self):
+        return [
+            AIMessage(content=m.content) if m.role == "ai" else HumanMessage(content=m.content)
+            for m in self.records
+        ]
+
+    def add_message(self, message):
+        role = "ai" if message.type == "ai" else "human"
+        self.records.append(Mensaje(role, message.content))
+
+    # ¿Llegó al tope de mensajes? La app deja de aceptar entradas en lugar de recortar
+    @property
+    def full(self):
+        return len(self.records) >= self.max_mensajes
+
+    def clear(self):
+        self.records.clear()
+
+
+# Convierte uno o varios historiales en texto plano ("HUMAN: ...\nAI: ...")
+# recorriendo los registros guardados, sin copiarlos a otro historial.
+def history_text(*histories):
+    return "\n".join(
+        f"{m.role.upper()}: {m.content}"
+        for history in histories
+        for m in history.records
+    )
+
+
+# Calcula de forma aproximada los bytes que ocupa un objeto y todo lo que referencia.
+def deep_sizeof(obj, seen=None):
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, s), seen) for s in obj.__slots__ if hasattr(obj, s))
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+# Devuelve los bytes usados por cada clave de la sesión, ordenados de mayor a menor.
+def session_bytes():
+    sizes = {str(k): deep_sizeof(v) for k, v in st.session_state.items()}
+    return dict(sorted(sizes.items(), key=lambda kv: kv[1], reverse=True))
+
+
+# Muestra en la barra lateral cuánta memoria usa la sesión actual (sólo para depuración).
+def render_memory_readout():
+    sizes = session_bytes()
+    with st.sidebar.expander("🔧 Memoria de la sesión", expanded=False):
+        st.markdown(f"**Total:** {sum(sizes.values()) / 1024:.1f} KiB")
+        st.table([{"clave": k, "bytes": v} for k, v in sizes.items()])
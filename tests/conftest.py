@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Los módulos de la app viven en la raíz del repositorio
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
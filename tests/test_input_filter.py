@@ -0,0 +1,105 @@
+import logging
+import os
+
+import pytest
+
+from conftest import ROOT
+from input_filter import InputFilter, LexicalModel, logger, tokenize
+from llm_config_espanol import LLMConfig
+from session_store import Mensaje
+
+CONFIG_FILE = os.path.join(ROOT, "config_natalia_v0.1_teachers.toml")
+
+
+@pytest.fixture(scope="module")
+def prefilter():
+    llm_prompts = LLMConfig(CONFIG_FILE)
+    return InputFilter(llm_prompts.prefilter, llm_prompts.prefilter_seed)
+
+
+def history(*turns):
+    return [Mensaje(role, content) for role, content in turns]
+
+
+@pytest.mark.parametrize("text", [
+    "Hola soy Pedro hombre",
+    "Ayer en el partido de fútbol de la escuela un alumno se lastimó",
+    "Mis alumnos no me hacen caso y me siento frustrada",
+])
+def test_normal_answers_go_to_llm(prefilter, text):
+    assert prefilter.classify(text, history(("ai", "**¿me puedes decir tu nombre?**"))).label == "llm"
+
+
+@pytest.mark.parametrize("text", [
+    "Dame una receta de pastel de chocolate",
+    "¿Cuál es la capital de Francia?",
+])
+def test_clearly_off_topic(prefilter, text):
+    assert prefilter.classify(text, []).label == "off_topic"
+
+
+def test_unknown_words_do_not_count_as_off_topic():
+    model = LexicalModel(["me siento cansada en clase"] * 10, ["cuentame un chiste"])
+    assert model.known_share(tokenize("Pedro hombre")) == 0.0
+    assert model.off_topic_probability(tokenize("siento palabras desconocidas")) < 0.5
+
+
+def test_empty_and_filler(prefilter):
+    assert prefilter.classify("  ", []).label == "empty"
+    assert prefilter.classify("ok jaja", []).label == "filler"
+
+
+def test_repeated_only_without_reply(prefilter):
+    pending = history(("ai", "**¿Pregunta uno?**"), ("human", "no"))
+    assert prefilter.classify("No", pending).label == "repeated"
+
+
+def test_same_answer_to_a_new_question_is_not_repeated(prefilter):
+    answered = history(("ai", "**¿Pregunta uno?**"), ("human", "no"), ("ai", "**¿Pregunta dos?**"))
+    assert prefilter.classify("no", answered).label != "repeated"
+
+    reprompted = history(("ai", "Escribe \"listo\""), ("human", "listo"), ("ai", "Por favor, escribe \"listo\""))
+    assert prefilter.classify("listo", reprompted).label == "llm"
+
+
+class FakeHistory:
+    def __init__(self, *turns):
+        self.records = history(*turns)
+
+    def add_user_message(self, text):
+        self.records.append(Mensaje("human", text))
+
+    def add_ai_message(self, text):
+        self.records.append(Mensaje("ai", text))
+
+
+@pytest.fixture
+def decisions():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger.addHandler(handler)
+    yield records
+    logger.removeHandler(handler)
+
+
+FILTER_CONFIG = {"fillers": ["ok"], "replies": {"filler": "Cuéntame más. {pregunta}"}}
+
+
+def test_shadow_mode_logs_but_never_answers(decisions):
+    chat = FakeHistory(("ai", "**¿Pregunta uno?**"))
+    shadow = InputFilter({**FILTER_CONFIG, "mode": "shadow"})
+    assert shadow.handle("ok", chat, "collection") is False
+    assert len(chat.records) == 1
+    assert "would_answer=True answered=False" in decisions[-1].getMessage()
+
+
+def test_on_mode_answers_from_template(decisions):
+    chat = FakeHistory(("ai", "**¿Pregunta uno?**"))
+    assert InputFilter({**FILTER_CONFIG, "mode": "on"}).handle("ok", chat, "collection") is True
+    assert chat.records[-1].content == "Cuéntame más. **¿Pregunta uno?**"
+
+
+def test_off_mode_does_nothing(decisions):
+    assert InputFilter({**FILTER_CONFIG, "mode": "off"}).handle("ok", FakeHistory(), "collection") is False
+    assert decisions == []
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import ROOT
+import regenerate_narratives
+
+CONFIG_FILE = os.path.join(ROOT, "config_natalia_v0.1_teachers.toml")
+
+
+# Servidor local compatible con la API de chat de OpenAI. Responde una narrativa en JSON,
+# salvo a los prompts que contienen alguna palabra de `failing` (responde 400, sin reintentos).
+class StubOpenAI(BaseHTTPRequestHandler):
+    failing = set()
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        StubOpenAI.requests.append(prompt)
+        if any(word in prompt for word in StubOpenAI.failing):
+            return self.reply(400, {"error": {"message": "fallo simulado", "type": "invalid_request_error"}})
+        self.reply(200, {
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": '{"output_scenario": "Narrativa\\nregenerada."}'}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubOpenAI.failing = set()
+    StubOpenAI.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+
+
+def session(session_id, answer):
+    return {
+        "session_id": session_id,
+        "primer_porque": "Original 1.",
+        "segundo_porque": "Original 2.",
+        "transcripts": {
+            "questions": [{"role": "ai", "content": "¿Qué te resulta difícil?"}, {"role": "human", "content": answer}],
+            "reflect": [{"role": "human", "content": "Estaba agitada."}],
+            "abcd": [],
+        },
+    }
+
+
+def read_output(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_regenerates_against_stub_and_resumes(tmp_path, stub_url):
+    sessions = tmp_path / "sesiones.jsonl"
+    sessions.write_text("\n".join(json.dumps(s, ensure_ascii=False) for s in [
+        session("s1", "Me siento sobrecargada."),
+        session("s2", "RESPUESTA_QUE_FALLA"),
+    ]), encoding="utf-8")
+    output = tmp_path / "comparacion.jsonl"
+    argv = ["--input", str(sessions), "--output", str(output), "--config", CONFIG_FILE,
+            "--base-url", stub_url, "--stages", "first", "--concurrency", "2"]
+
+    # Primera corrida: s2 falla y queda registrada con su error
+    StubOpenAI.failing = {"RESPUESTA_QUE_FALLA"}
+    assert regenerate_narratives.main(argv) == 1
+    records = {r["session_id"]: r for r in read_output(output)}
+    assert "error" in records["s2"]
+    assert set(records["s1"]["regenerated"]["primer_porque"].values()) == {"Narrativa regenerada."}
+
+    # Segunda corrida: sólo se reintenta s2 y queda una línea por sesión
+    StubOpenAI.failing = set()
+    StubOpenAI.requests = []
+    assert regenerate_narratives.main(argv) == 0
+    assert all("RESPUESTA_QUE_FALLA" in prompt for prompt in StubOpenAI.requests)
+    lines = read_output(output)
+    assert sorted(r["session_id"] for r in lines) == ["s1", "s2"]
+    assert all("error" not in r for r in lines)
+
+    # Otra selección de etapas no reanuda sobre el mismo archivo
+    StubOpenAI.requests = []
+    with pytest.raises(SystemExit):
+        regenerate_narratives.main(argv[:-4] + ["--stages", "first,second", "--concurrency", "2"])
+    assert StubOpenAI.requests == []
+    assert len(read_output(output)) == 2
@@ -0,0 +1,35 @@
+import json
+import glob
+import os
+import time
+
+import rerun_profiler
+
+# Simula reruns consecutivos de st.rerun(): el mismo "script" se ejecuta varias veces
+# seguidas en el mismo hilo, sin un hueco entre uno y otro.
+SCRIPT = """
+import time
+profiler = rerun_profiler.RerunProfiler(SCRIPT_PATH, OUT_DIR, interval=0.002).start()
+profiler.tag(session_id="s", agentState=STATE)
+time.sleep(0.05)
+"""
+
+
+def test_back_to_back_reruns_get_separate_profiles(tmp_path):
+    script_path = str(tmp_path / "app.py")
+    code = compile(SCRIPT, script_path, "exec")
+    profilers = []
+    for state in ("a", "b", "c"):
+        namespace = {"rerun_profiler": rerun_profiler, "SCRIPT_PATH": script_path,
+                     "OUT_DIR": str(tmp_path), "STATE": state}
+        exec(code, namespace)
+        profilers.append(namespace["profiler"])
+
+    deadline = time.time() + 2
+    while not all(p.done for p in profilers) and time.time() < deadline:
+        time.sleep(0.01)
+
+    walls = [p.wall_s for p in profilers]
+    assert all(0.04 < w < 0.09 for w in walls), walls
+    reports = [json.load(open(f)) for f in glob.glob(os.path.join(tmp_path, "*.json"))]
+    assert sorted(r["tags"]["agentState"] for r in reports) == ["a", "b", "c"]
@@ -0,0 +1,79 @@
+import hashlib
+
+import pytest
+
+from session_store import Mensaje
+from transcript_store import (CHUNK_CHARS, assemble_transcripts, load_transcripts, parse_summary_row,
+                              save_transcripts, summary_row)
+
+
+class FakeHistory:
+    def __init__(self, records):
+        self.records = records
+
+
+class FakeWorksheet:
+    def __init__(self):
+        self.rows = []
+
+    def append_rows(self, rows, **kwargs):
+        self.rows.extend(rows)
+
+    # Sheets devuelve todas las celdas como texto
+    def get_all_values(self):
+        return [[str(cell) for cell in row] for row in self.rows]
+
+
+# Texto que zlib casi no comprime, para que la transcripción ocupe varios trozos
+def incompressible(n_chars, seed):
+    text = ""
+    while len(text) < n_chars:
+        seed = hashlib.sha256(seed.encode("utf-8")).hexdigest()
+        text += seed
+    return text[:n_chars]
+
+
+@pytest.fixture
+def long_histories():
+    return {
+        "questions": FakeHistory([Mensaje("ai", "¿Qué te resulta más difícil?"),
+                                  Mensaje("human", incompressible(2 * CHUNK_CHARS, "a"))]),
+        "reflect": FakeHistory([Mensaje("ai", "Listo"), Mensaje("human", "Estaba muy agitada.")]),
+    }
+
+
+def test_round_trip_across_several_chunks(long_histories):
+    ws = FakeWorksheet()
+    ws.append_rows([["otra-sesion", 0, 1, "z1:basura"]])
+    n_chunks = save_transcripts(ws, "s1", long_histories)
+
+    assert n_chunks > 1
+    assert all(len(row[3]) <= CHUNK_CHARS for row in ws.rows)
+    loaded = load_transcripts(ws, "s1")
+    assert loaded == {
+        name: [{"role": m.role, "content": m.content} for m in history.records]
+        for name, history in long_histories.items()
+    }
+
+
+def test_missing_chunk_raises(long_histories):
+    ws = FakeWorksheet()
+    save_transcripts(ws, "s1", long_histories)
+    rows = ws.get_all_values()
+    del rows[1]
+
+    with pytest.raises(ValueError, match="incompleta"):
+        assemble_transcripts(rows, "s1")
+
+
+def test_unknown_session_raises():
+    with pytest.raises(KeyError):
+        assemble_transcripts([["s1", "0", "1", "z1:"]], "s2")
+
+
+def test_summary_rows():
+    row = summary_row("2025-01-01T10:00:00", "primero", "segundo", "s1")
+    assert parse_summary_row([str(cell) for cell in row])["session_id"] == "s1"
+    # Fila antigua: la columna D guardaba la transcripción y no hay marca de formato
+    assert parse_summary_row(["2024-05-01T10:00:00", "primero", "segundo", "AI: Hola\nHUMAN: Hola"]) is None
+    assert parse_summary_row(["fecha", "primer_porque", "segundo_porque", "transcripcion", ""]) is None
@@ -0,0 +1,95 @@
+import base64
+import json
+import zlib
+
+import gspread
+
+# === ALMACÉN DE TRANSCRIPCIONES EN GOOGLE SHEETS ===
+# Las transcripciones se guardan comprimidas en una hoja aparte, partidas en filas
+# de tamaño acotado y referenciadas por el id de sesión desde la fila de resumen.
+
+TRANSCRIPTS_WORKSHEET = "transcripts"
+CHUNK_CHARS = 45000          # Por debajo del límite de 50,000 caracteres por celda de Sheets
+ENCODING_VERSION = "z1"      # JSON -> zlib -> base64; permite cambiar el formato más adelante
+# Marca de la fila de resumen (columna E). Las filas antiguas no la tienen y guardaban la
+# transcripción de preguntas en la columna D; con la marca, la columna D es el id de sesión.
+SUMMARY_FORMAT = "t1"
+
+
+# Convierte los historiales en un texto compacto: JSON con [rol, contenido] por mensaje,
+# comprimido con zlib y codificado en base64 para poder guardarlo en una celda.
+def encode_transcripts(histories):
+    payload = {
+        name: [[m.role, m.content] for m in history.records]
+        for name, history in histories.items()
+    }
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return ENCODING_VERSION + ":" + base64.b64encode(zlib.compress(raw, 9)).decode("ascii")
+
+
+# Operación inversa de encode_transcripts: devuelve {nombre: [{"role", "content"}, ...]}
+def decode_transcripts(encoded):
+    version, _, data = encoded.partition(":")
+    if version != ENCODING_VERSION:
+        raise ValueError(f"Formato de transcripción desconocido: {version!r}")
+    payload = json.loads(zlib.decompress(base64.b64decode(data)).decode("utf-8"))
+    return {
+        name: [{"role": role, "content": content} for role, content in messages]
+        for name, messages in payload.items()
+    }
+
+
+# Parte el texto codificado en trozos que caben en una celda
+def split_chunks(encoded, chunk_chars=CHUNK_CHARS):
+    return [encoded[i:i + chunk_chars] for i in range(0, len(encoded), chunk_chars)] or [""]
+
+
+# Devuelve la hoja de transcripciones, creándola si todavía no existe
+def get_transcript_worksheet(spreadsheet):
+    try:
+        return spreadsheet.worksheet(TRANSCRIPTS_WORKSHEET)
+    except gspread.WorksheetNotFound:
+        ws = spreadsheet.add_worksheet(title=TRANSCRIPTS_WORKSHEET, rows=1, cols=4)
+        ws.append_row(["session_id", "chunk", "n_chunks", "data"])
+        return ws
+
+
+# Guarda las transcripciones de una sesión en una sola petición (una fila por trozo)
+def save_transcripts(worksheet, session_id, histories):
+    chunks = split_chunks(encode_transcripts(histories))
+    rows = [[session_id, i, len(chunks), chunk] for i, chunk in enumerate(chunks)]
+    worksheet.append_rows(rows, value_input_option="RAW")
+    return len(chunks)
+
+
+# Fila de resumen de una sesión: fecha, primer_porque, segundo_porque, session_id, formato
+def summary_row(timestamp, primer_porque, segundo_porque, session_id):
+    return [timestamp, primer_porque, segundo_porque, session_id, SUMMARY_FORMAT]
+
+
+# Interpreta una fila de resumen; devuelve None si no tiene la marca de formato (fila antigua)
+def parse_summary_row(row):
+    if len(row) < 5 or row[4] != SUMMARY_FORMAT or not row[3]:
+        return None
+    return {"timestamp": row[0], "primer_porque": row[1], "segundo_porque": row[2], "session_id": row[3]}
+
+
+# Reúne los trozos de una sesión a partir de las filas de la hoja y los decodifica
+def assemble_transcripts(rows, session_id):
+    chunks = {}
+    n_chunks = None
+    for row in rows:
+        if len(row) < 4 or row[0] != session_id:
+            continue
+        chunks[int(row[1])] = row[3]
+        n_chunks = int(row[2])
+    if n_chunks is None:
+        raise KeyError(f"No hay transcripciones para la sesión {session_id}")
+    if len(chunks) != n_chunks:
+        raise ValueError(f"Transcripción incompleta para {session_id}: {len(chunks)}/{n_chunks} trozos")
+    return decode_transcripts("".join(chunks[i] for i in range(n_chunks)))
+
+
+# Lee y reensambla las transcripciones de una sesión guardada
+def load_transcripts(worksheet, session_id):
+    return assemble_transcripts(worksheet.get_all_values(), session_id)